@@ -21,6 +21,9 @@
 # arithmetic as required by the instruction set architecture.
 # ------------------------------------------------------------------------
 
+import sys
+from array import array
+
 import common
 import architecture as arch
 
@@ -66,7 +69,8 @@ def assert64(x):
 
 def truncate_word(x):
     r = x & 0xFFFF
-    common.mode.devlog(f"truncate_word x{word_to_hex4(x)} r={word_to_hex4(r)}")
+    if common.mode.trace:
+        common.mode.devlog(f"truncate_word x{word_to_hex4(x)} r={word_to_hex4(r)}")
     return r
 
 def truncate_word32(x):
@@ -89,51 +93,40 @@ def logic_function(mnemonic):
     else:
         return 0
 
+# The logic function code fcn is a truth table: bit 3 gives the result
+# for x=0 y=0, bit 2 for x=0 y=1, bit 1 for x=1 y=0, bit 0 for x=1 y=1
+
 def apply_logic_fcn_bit(fcn, x, y):
-    if x == 0:
-        result = arch.get_bit_in_word_le(fcn, 3) if y == 0 else arch.get_bit_in_word_le(fcn, 2)
-    else:
-        result = arch.get_bit_in_word_le(fcn, 1) if y == 0 else arch.get_bit_in_word_le(fcn, 0)
-    common.mode.devlog(f"apply_logic_fcn fcn={fcn} x={x} y={y} result={result}")
+    result = (fcn >> (3 - 2 * x - y)) & 1
+    if common.mode.trace:
+        common.mode.devlog(f"apply_logic_fcn fcn={fcn} x={x} y={y} result={result}")
     return result
 
+# Apply the truth table to all 16 bit positions of x and y at once
+
+def logic_fcn_word_bits(fcn, x, y):
+    nx = ~x
+    ny = ~y
+    result = 0
+    if fcn & 8: result |= nx & ny
+    if fcn & 4: result |= nx & y
+    if fcn & 2: result |= x & ny
+    if fcn & 1: result |= x & y
+    return result & 0xFFFF
+
 def lut(p, q, r, s, x, y):
     return p if x == 0 and y == 0 else q if x == 0 else r if y == 0 else s
 
 def apply_logic_fcn_field(fcn, x, y, idx1, idx2):
-    p = arch.get_bit_in_word_le(fcn, 3)
-    q = arch.get_bit_in_word_le(fcn, 2)
-    r = arch.get_bit_in_word_le(fcn, 1)
-    s = arch.get_bit_in_word_le(fcn, 0)
-    result = 0
-    b = 0
-    i = 0
-    while i < 16 and i < idx1:
-        b = arch.get_bit_in_word_le(x, i)
-        result = arch.put_bit_in_word_le(16, result, i, b)
-        i += 1
-    while i < 16 and i <= idx2:
-        b = lut(p, q, r, s, arch.get_bit_in_word_le(x, i), arch.get_bit_in_word_le(y, i))
-        result = arch.put_bit_in_word_le(16, result, i, b)
-        i += 1
-    while i < 16:
-        b = arch.get_bit_in_word_le(x, i)
-        result = arch.put_bit_in_word_le(16, result, i, b)
-        i += 1
-    return result
+    # Bits idx1..idx2 take the logic function, the rest are copied from x
+    fmask = ((1 << (idx2 + 1)) - 1) & ~((1 << idx1) - 1) & 0xFFFF
+    return (x & ~fmask & 0xFFFF) | (logic_fcn_word_bits(fcn, x, y) & fmask)
 
 def apply_logic_fcn_word(fcn, x, y):
-    common.mode.devlog(f"apply_logic_fcn_word fcn={fcn} x={word_to_hex4(x)} y={word_to_hex4(y)}")
-    p = arch.get_bit_in_word_le(fcn, 3)
-    q = arch.get_bit_in_word_le(fcn, 2)
-    r = arch.get_bit_in_word_le(fcn, 1)
-    s = arch.get_bit_in_word_le(fcn, 0)
-    result = 0
-    for i in range(16):
-        z = lut(p, q, r, s, arch.get_bit_in_word_le(x, i), arch.get_bit_in_word_le(y, i))
-        if z == 1:
-            result = result | arch.mask_to_set_bit_le(i)
-    common.mode.devlog(f"apply_logic_fcn_word result={word_to_hex4(result)}")
+    result = logic_fcn_word_bits(fcn, x, y)
+    if common.mode.trace:
+        common.mode.devlog(f"apply_logic_fcn_word fcn={fcn} x={word_to_hex4(x)} y={word_to_hex4(y)}")
+        common.mode.devlog(f"apply_logic_fcn_word result={word_to_hex4(result)}")
     return result
 
 # ------------------------------------------------------------------------
@@ -229,6 +222,15 @@ def word_to_hex4(x):
     result = hex_digit[p] + hex_digit[q] + hex_digit[r] + hex_digit[s]
     return result
 
+# Hex digits for a whole sequence of words in one call: 4 digits per
+# word, from the big-endian bytes
+
+def words_to_hex(ws):
+    be = array('H', ws)
+    if sys.byteorder == "little":
+        be.byteswap()
+    return be.tobytes().hex()
+
 def word_to_hex8(x):
     y = limit32(x)
     h = y & 0x000F
@@ -249,7 +251,15 @@ def word_to_hex8(x):
     return hex_digit[a] + hex_digit[b] + hex_digit[c] + hex_digit[d] + \
            ' ' + hex_digit[e] + hex_digit[f] + hex_digit[g] + hex_digit[h]
 
+_hex4_cache = {} # hex4 string -> word, object code reuses the same strings
+
 def hex4_to_word(h):
+    w = _hex4_cache.get(h)
+    if w is None:
+        w = _hex4_cache[h] = _parse_hex4(h)
+    return w
+
+def _parse_hex4(h):
     if len(h) != 4:
         return float('nan')
     return (16**3 * hex_char_to_int(h[0]) +
@@ -298,10 +308,10 @@ def op_shift(a, k):
     return [primary, secondary]
 
 def shift_l(x, k):
-    return truncate_word(x << k)
+    return (x << k) & 0xFFFF
 
 def shift_r(x, k):
-    return truncate_word(x >> k) # Use >> for arithmetic right shift
+    return (x >> k) & 0xFFFF
 
 def addition_cc(c, a, b, primary, sum_val):
     msba = arch.get_bit_in_word_le(a, 15)
@@ -465,29 +475,31 @@ def calculate_extract(wsize, wmask, dest, src,
     p = sclear >> (src_left - field_size + 1)
     q = p << (dest_left - field_size + 1)
     r = dclear | q
-    common.mode.devlog(f"calculate_extract wsize={wsize} wmask={word_to_hex4(wmask)}" +
-                       f" dest={word_to_hex4(dest)}" +
-                       f" src={word_to_hex4(src)}" +
-                       f" dest_right={dest_right}" +
-                       f" dest_left={dest_left}" +
-                       f" src_right={src_right}" +
-                       f" src_left={src_left}" +
-                       f" field_size={field_size}" +
-                       f" dmask={word_to_hex4(dmask)}" +
-                       f" dmaski={word_to_hex4(dmaski)}" +
-                       f" dclear={word_to_hex4(dclear)}" +
-                       f" smask={word_to_hex4(smask)}" +
-                       f" sclear={word_to_hex4(sclear)}" +
-                       f" p={word_to_hex4(p)}" +
-                       f" q={word_to_hex4(q)}" +
-                       f" r={word_to_hex4(r)}")
+    if common.mode.trace:
+        common.mode.devlog(f"calculate_extract wsize={wsize} wmask={word_to_hex4(wmask)}" +
+                           f" dest={word_to_hex4(dest)}" +
+                           f" src={word_to_hex4(src)}" +
+                           f" dest_right={dest_right}" +
+                           f" dest_left={dest_left}" +
+                           f" src_right={src_right}" +
+                           f" src_left={src_left}" +
+                           f" field_size={field_size}" +
+                           f" dmask={word_to_hex4(dmask)}" +
+                           f" dmaski={word_to_hex4(dmaski)}" +
+                           f" dclear={word_to_hex4(dclear)}" +
+                           f" smask={word_to_hex4(smask)}" +
+                           f" sclear={word_to_hex4(sclear)}" +
+                           f" p={word_to_hex4(p)}" +
+                           f" q={word_to_hex4(q)}" +
+                           f" r={word_to_hex4(r)}")
     return r
 
 def field_mask(wsize, wmask, i, fsize):
     p = wmask >> (wsize - fsize)
     q = p << (i - fsize + 1)
-    common.mode.devlog(f"field_mask wsize={wsize} wmask={word_to_hex4(wmask)}" +
-                       f" i={i} fsize={fsize} p={word_to_hex4(p)} q={word_to_hex4(q)}")
+    if common.mode.trace:
+        common.mode.devlog(f"field_mask wsize={wsize} wmask={word_to_hex4(wmask)}" +
+                           f" i={i} fsize={fsize} p={word_to_hex4(p)} q={word_to_hex4(q)}")
     return q
 
 def calculate_extracti(wsize, fsize, x, xi, y, yi):
@@ -181,6 +181,11 @@ def decr_instr_count(es):
 def read_reg16(es, r):
     return 0 if r == 0 else read16(es, r * 2, REG_OFFSET16)
 
+def read_regs16(es):
+    # All 16 registers at once; each sits in a 32-bit slot, and R0's slot
+    # is never written so it reads 0
+    return es.vec16[REG_OFFSET16:REG_OFFSET16 + 32:2]
+
 def read_reg32(es, r):
     return 0 if r == 0 else read32(es, r, REG_OFFSET32)
 
@@ -201,6 +206,18 @@ def read_mem16(es, a):
 
 def write_mem16(es, a, x):
     write16(es, a, MEM_OFFSET16, x)
+    es.dirty_addrs.add(a)
+
+# Block access to n consecutive memory words starting at a
+
+def read_mem16_block(es, a, n):
+    k = a + MEM_OFFSET16
+    return es.vec16[k:k + n]
+
+def write_mem16_block(es, a, xs):
+    k = a + MEM_OFFSET16
+    es.vec16[k:k + len(xs)] = [arith.limit16(x) for x in xs]
+    es.dirty_addrs.update(range(a, a + len(xs)))
 
 def read_mem32(es, a):
     common.mode.devlog(f"read_mem32 a={a}...")
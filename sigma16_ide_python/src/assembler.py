@@ -19,6 +19,7 @@
 # ---------------------------------------------------------------------
 
 import re
+import sys
 import common
 import state as st
 import architecture as arch
@@ -462,6 +463,8 @@ def asm_pass1(ma):
 
 def handle_label(ma, s):
     if s["hasLabel"]:
+        # Interned, as it becomes a symbol table key and Identifier name
+        s["fieldLabel"] = sys.intern(s["fieldLabel"])
         common.mode.devlog(f"ParseAsmLine label {s["lineNumber"]} /{s["fieldLabel"]}/")
         if s["fieldLabel"] in ma.symbol_table:
             mk_err_msg(ma, s, f"{s["fieldLabel"]} has already been defined")
@@ -18,6 +18,10 @@
 # emulator.py defines the machine language semantics
 # -------------------------------------------------------------------------
 
+import collections
+import functools
+import itertools
+
 import common
 import architecture as arch
 import arithmetic as arith
@@ -33,6 +37,10 @@ import s16module as smod
 
 default_timer_resolution = 0
 
+# Per-instruction tracing in the EXP handlers; when False none of the
+# trace messages are even formatted
+DEBUG = False
+
 # -----------------------------------------------------------------------
 # Access to system control register flags
 # -----------------------------------------------------------------------
@@ -54,6 +62,10 @@ def set_status_bit(es, i, x):
 def limit_address(es, x):
     return x & es.address_mask
 
+# arch.mem_size is a power of two, so the EXP handlers wrap branch
+# targets with a plain mask rather than a call to limit_address
+mem_mask = arch.mem_size - 1
+
 def show_es_info(es):
     return (f"show_es_info thread={es.thread_host}\n" +
             f"  reg_fetched = {es.copyable["regFetched"]}\n" +
@@ -69,6 +81,7 @@ def init_reg_highlighting(es):
     es.reg_stored_old = []
     es.copyable["regFetched"] = []
     es.copyable["regStored"] = []
+    es.copyable["regStoredLast"] = {}
 
 # ------------------------------------------------------------------------
 # Emulator state
@@ -79,6 +92,7 @@ init_es_copyable = {
     "breakEnabled": False,
     "regFetched": [],
     "regStored": [],
+    "regStoredLast": {},
     "memFetchInstrLog": [],
     "memFetchDataLog": [],
     "memStoreLog": [],
@@ -126,7 +140,14 @@ class EmulatorState:
         self.instr_looper_show = False
         self.break_enabled = False
         self.do_interrupt = 0
+        self.halt_reason = None
         self.io_log_buffer = ""
+        # Record register and memory accesses for highlighting and the
+        # access summaries; worker-thread runs and the GUI, which doesn't
+        # show the logs, skip this bookkeeping
+        self.trace_enabled = thread_host != common.ES_worker_thread
+        # Memory addresses written since the GUI last refreshed its views
+        self.dirty_addrs = set()
         self.address_mask = arith.word16mask
         self.pc = None
         self.ir = None
@@ -152,11 +173,7 @@ class EmulatorState:
         self.ir_b = 0
         self.ea = 0
         self.instr_disp = 0
-        self.field_e = 0
-        self.field_f = 0
-        self.field_g = 0
-        self.field_h = 0
-        self.field_gh = 0
+        self.exp_fields = DecodedExp(0, 0, 0, 0, 0)
         self.instr_op_code = None
         self.instr_code_str = ""
         self.instr_fmt_str = ""
@@ -224,31 +241,42 @@ class GenRegister:
         self.es = es
         self.reg_st_index = es.n_registers
         self.reg_number = es.n_registers
+        # The register lives directly in the flat state vector es.vec16,
+        # so get/put index it without going through arrbuf
+        self.vec_index = arrbuf_module.REG_OFFSET16 + 2 * self.reg_st_index
         es.n_registers += 1
         self.reg_name = reg_name
+        self.dump_prefix = f"{reg_name}: "
         self.elt_name = elt_name
         self.show = show_fcn
         self.elt = None # GUI element, will be set later
         es.register.append(self)
 
     def get(self):
-        x = self.ab.read_reg16(self.es, self.reg_st_index)
-        self.es.copyable["regFetched"].append((self.reg_number, x))
+        # R0 is never written, so its slot always reads 0
+        x = self.es.vec16[self.vec_index]
+        if self.es.trace_enabled:
+            self.es.copyable["regFetched"].append((self.reg_number, x))
         return x
 
     def get32(self):
-        self.es.copyable["regFetched"].append(self.reg_number)
+        if self.es.trace_enabled:
+            self.es.copyable["regFetched"].append(self.reg_number)
         x = self.ab.read_reg32(self.es, self.reg_st_index)
         return x
 
     def put(self, x):
-        self.es.copyable["regStored"].append((self.reg_number, x))
-        self.ab.write_reg16(self.es, self.reg_number, x)
+        if self.es.trace_enabled:
+            self.es.copyable["regStored"].append((self.reg_number, x))
+            self.es.copyable["regStoredLast"][self.reg_number] = x
+        if self.reg_number != 0:
+            self.es.vec16[self.vec_index] = x & 0xFFFF
         # if self.reg_idx < 16: # register file
         #     self.es.instr_effect.append(["R", self.reg_number, x, self.reg_name])
 
     def put32(self, x):
-        self.es.copyable["regStored"].append(self.reg_number)
+        if self.es.trace_enabled:
+            self.es.copyable["regStored"].append(self.reg_number)
         self.ab.write_reg32(self.es, self.reg_number, x)
         # if self.reg_idx < 16: # register file
         #     self.es.instr_effect.append(["R", self.reg_number, x, self.reg_name])
@@ -272,18 +300,21 @@ def mem_clear(es):
 
 def mem_fetch_instr(es, a):
     x = es.ab.read_mem16(es, a)
-    es.copyable["memFetchInstrLog"].append((a, x))
+    if es.trace_enabled:
+        es.copyable["memFetchInstrLog"].append((a, x))
     common.mode.devlog(f"mem_fetch_instr a={arith.word_to_hex4(a)} x={arith.word_to_hex4(x)}")
     return x
 
 def mem_fetch_data(es, a):
     x = es.ab.read_mem16(es, a)
-    es.copyable["memFetchDataLog"].append((a, x))
+    if es.trace_enabled:
+        es.copyable["memFetchDataLog"].append((a, x))
     return x
 
 def mem_store(es, a, x):
-    es.copyable["memStoreLog"].append((a, x))
-    es.instr_effect.append(["M", a, x])
+    if es.trace_enabled:
+        es.copyable["memStoreLog"].append((a, x))
+        es.instr_effect.append(["M", a, x])
     es.ab.write_mem16(es, a, x)
 
 # -------------------------------------------------------------------------
@@ -293,6 +324,7 @@ def mem_store(es, a, x):
 def proc_reset(es):
     common.mode.devlog("reset the processor")
     es.ab.reset_scb(es)
+    es.halt_reason = None
     reset_registers(es)
     mem_clear(es)
     timer_initialize(es, default_timer_resolution)
@@ -320,36 +352,47 @@ def main_run(es):
     instruction_looper(es)
 
 def instruction_looper(es):
+    execute = execute_instruction_traced if es.trace_enabled else execute_instruction_fast
+    slice_size = es.em_instr_slice_size
     icount = 0
-    continue_running = True
     finished = False
+    pause_req = False
     external_break = False
+    es.halt_reason = None # left over from a previous pause, break or halt
 
-    while continue_running:
-        execute_instruction(es)
+    # Handlers that stop the processor set es.halt_reason alongside the
+    # SCB status, so only that flag is checked per instruction; the
+    # pause request is polled once per slice
+    while True:
+        execute(es)
         icount += 1
-        status = es.ab.read_scb(es, es.ab.SCB_STATUS)
-        common.mode.devlog(f"looper after instruction, status={status}")
-
-        if status in [es.ab.SCB_HALTED, es.ab.SCB_PAUSED, es.ab.SCB_BREAK, es.ab.SCB_RELINQUISH]:
+        if es.halt_reason is not None:
+            common.mode.devlog(f"looper after instruction, halt_reason={es.halt_reason}")
             finished = True
+            break
 
         external_break = es.copyable["breakEnabled"] and (es.pc.get() == es.copyable["breakPCvalue"])
         if external_break:
             finished = True
+            break
 
-        pause_req = es.ab.read_scb(es, es.ab.SCB_PAUSE_REQUEST) != 0
-        count_ok = es.slice_unlimited or icount < es.em_instr_slice_size
-        continue_running = not finished and not pause_req and count_ok
+        if icount % slice_size == 0:
+            pause_req = es.ab.read_scb(es, es.ab.SCB_PAUSE_REQUEST) != 0
+            if pause_req or not es.slice_unlimited:
+                break
 
     common.mode.devlog('discontinue instruction looper')
+    status = es.ab.read_scb(es, es.ab.SCB_STATUS)
     if pause_req and status != es.ab.SCB_HALTED:
         common.mode.devlog("pausing execution")
         es.ab.write_scb(es, es.ab.SCB_STATUS, es.ab.SCB_PAUSED)
         es.ab.write_scb(es, es.ab.SCB_PAUSE_REQUEST, 0)
+        es.halt_reason = "paused"
+        finished = True
     elif external_break:
         print("Stopping at breakpoint")
         es.ab.write_scb(es, es.ab.SCB_STATUS, es.ab.SCB_BREAK)
+        es.halt_reason = "break"
 
     if finished:
         if es.end_run_display:
@@ -432,6 +475,7 @@ def clear_mem_logging(es):
 def clear_reg_logging(es):
     es.copyable["regFetched"] = []
     es.copyable["regStored"] = []
+    es.copyable["regStoredLast"] = {}
 
 # -------------------------------------------------------------------------
 # Machine language semantics
@@ -450,14 +494,49 @@ def clear_instr_decode(es):
     es.instr_effect2 = ""
     es.instr_effect = []
 
+# The four fields (op, d, a, b) of every possible instruction word,
+# so decoding the first word of an instruction is a single lookup
+
+decode_rrr = tuple((w >> 12, (w >> 8) & 0x000F, (w >> 4) & 0x000F, w & 0x000F)
+                   for w in range(65536))
+
+# execute_instruction_traced resets the access logs and decode display
+# before each instruction; execute_instruction_fast skips that when
+# tracing is off. Loops choose one of them once rather than checking
+# es.trace_enabled on every instruction.
+
 def execute_instruction(es):
-    common.mode.devlog(f"em.execute_instruction starting")
+    if es.trace_enabled:
+        execute_instruction_traced(es)
+    else:
+        execute_instruction_fast(es)
+
+# Execute up to n instructions, stopping early when one of them halts
+# the processor (es.halt_reason is set); returns the number executed.
+# This is the unit of work for threads that drive the emulator, so the
+# per-instruction dispatch choice is made once per batch
+
+def execute_batch(es, n):
+    execute = execute_instruction_traced if es.trace_enabled else execute_instruction_fast
+    es.halt_reason = None
+    for i in range(n):
+        execute(es)
+        if es.halt_reason is not None:
+            return i + 1
+    return n
+
+def execute_instruction_traced(es):
     clear_reg_logging(es)
     clear_mem_logging(es)
     clear_instr_decode(es)
+    execute_instruction_fast(es)
+
+def execute_instruction_fast(es):
+    common.mode.devlog(f"em.execute_instruction starting")
+    addr_mask = es.address_mask
 
     # Store PC before execution, this is the address of the instruction being executed
-    executed_instr_addr = es.pc.get() 
+    executed_instr_addr = es.pc.get()
 
     es.ab.write_scb(es, es.ab.SCB_CUR_INSTR_ADDR, executed_instr_addr)
 
@@ -467,7 +546,7 @@ def execute_instruction(es):
         common.mode.devlog("execute instruction: interrupt")
         print('Interrupting')
         i = 0
-        while i < 16 and arch.get_bit_in_word_le(mr, i) == 0:
+        while i < 16 and (mr >> i) & 1 == 0:
             i += 1
         common.mode.devlog(f"\n*** Interrupt {i} ***")
         es.rpc.put(es.pc.get())
@@ -475,7 +554,7 @@ def execute_instruction(es):
         es.iir.put(es.ir.get())
         es.iadr.put(es.adr.get())
         arch.clear_bit_in_reg_le(es.req, i)
-        es.pc.put(limit_address(es, es.vect.get() + 2 * i))
+        es.pc.put((es.vect.get() + 2 * i) & addr_mask)
         es.status_reg.put(es.status_reg.get() & \
                            arch.mask_to_clear_bit_le(arch.int_enable_bit) & \
                            arch.mask_to_clear_bit_le(arch.user_state_bit))
@@ -483,30 +562,43 @@ def execute_instruction(es):
         return
 
     common.mode.devlog("no interrupt, proceeding...")
-    es.instr_code = mem_fetch_instr(es, executed_instr_addr)
-    common.mode.devlog(f"ExInstr ir={arith.word_to_hex4(es.instr_code)}")
-    es.ir.put(es.instr_code)
-    es.next_instr_addr = arith.incr_address(es, executed_instr_addr, 1)
-    es.pc.put(limit_address(es, es.next_instr_addr))
-    es.ab.write_scb(es, es.ab.SCB_NEXT_INSTR_ADDR, es.next_instr_addr)
-    common.mode.devlog(f"ExInstr pcnew={arith.word_to_hex4(es.next_instr_addr)}")
+    ab = es.ab
+    instr_code = mem_fetch_instr(es, executed_instr_addr)
+    es.instr_code = instr_code
+    common.mode.devlog(f"ExInstr ir={arith.word_to_hex4(instr_code)}")
+    es.ir.put(instr_code)
 
     temp_instr = es.ir.get()
     common.mode.devlog(f"ExInstr instr={arith.word_to_hex4(temp_instr)}")
-    es.ir_b = temp_instr & 0x000F
-    temp_instr >>= 4
-    es.ir_a = temp_instr & 0x000F
-    temp_instr >>= 4
-    es.ir_d = temp_instr & 0x000F
-    temp_instr >>= 4
-    es.ir_op = temp_instr & 0x000F
+    op, d, a, b = decode_rrr[temp_instr]
+    es.ir_op = op
+    es.ir_d = d
+    es.ir_a = a
+    es.ir_b = b
+
+    # RX and EXP are two words: fetch and decode the second word here so
+    # the rx/exp2 wrappers don't need a second trip through mem_fetch_instr
+    if op == 0xF:
+        es.instr_disp = mem_fetch_instr(es, (executed_instr_addr + 1) & addr_mask)
+        nia = (executed_instr_addr + 2) & addr_mask
+    elif op == 0xE and ((a << 4) | b) < limit_exp_code:
+        disp = mem_fetch_instr(es, (executed_instr_addr + 1) & addr_mask)
+        es.instr_disp = disp
+        es.exp_fields = decode_exp_fields(disp)
+        nia = (executed_instr_addr + 2) & addr_mask
+    else:
+        nia = (executed_instr_addr + 1) & addr_mask
+    es.next_instr_addr = nia
+    es.pc.put(nia)
+    ab.write_scb(es, ab.SCB_NEXT_INSTR_ADDR, nia)
+    common.mode.devlog(f"ExInstr pcnew={arith.word_to_hex4(nia)}")
 
     es.instr_fmt_str = "RRR"
-    es.instr_op_str = arch.mnemonicRRR[es.ir_op]
-    common.mode.devlog(f"ExInstr dispatch primary opcode {es.ir_op}")
+    es.instr_op_str = arch.mnemonicRRR[op]
+    common.mode.devlog(f"ExInstr dispatch primary opcode {op}")
 
-    dispatch_primary_opcode[es.ir_op](es)
-    es.ab.incr_instr_count(es)
+    dispatch_primary_opcode[op](es)
+    ab.incr_instr_count(es)
     timer_tick(es)
 
     # After instruction execution and PC update, set cur_instr_addr to the instruction that was just executed
@@ -604,16 +696,22 @@ def cab_dca(f):
         es.regfile[es.ir_a].put(tertiary)
     return inner
 
-def exp2_add32(es):
-    print("exp2_add32 start")
-    x = es.regfile[es.field_e].get32()
-    print(f"exp2_add32 x = {x}")
-    y = es.regfile[es.field_f].get32()
-    print(f"exp2_add32 y = {y}")
+def exp2_add32(es, d):
+    if DEBUG:
+        common.mode.devlog("exp2_add32 start")
+    re, rf = d.e, d.f
+    x = es.regfile[re].get32()
+    if DEBUG:
+        common.mode.devlog(f"exp2_add32 x = {x}")
+    y = es.regfile[rf].get32()
+    if DEBUG:
+        common.mode.devlog(f"exp2_add32 y = {y}")
     result = x + y
-    print(f"exp2_add32 result = {result}")
+    if DEBUG:
+        common.mode.devlog(f"exp2_add32 result = {result}")
     es.regfile[es.ir_d].put32(result)
-    print("exp2_add32 end")
+    if DEBUG:
+        common.mode.devlog("exp2_add32 end")
 
 def op_trap(es):
     print("op_trap")
@@ -627,6 +725,7 @@ def op_trap(es):
             print("Trap: halt")
             common.mode.devlog("Trap: halt")
             es.ab.write_scb(es, es.ab.SCB_STATUS, es.ab.SCB_HALTED)
+            es.halt_reason = "halted"
         elif code == 1:
             print('trap: nonblocking read')
             trap_read(es)
@@ -638,12 +737,14 @@ def op_trap(es):
         elif code == 4:
             print('trap: break')
             es.ab.write_scb(es, es.ab.SCB_STATUS, es.ab.SCB_BREAK)
+            es.halt_reason = "break"
         else:
             common.mode.devlog(f"trap with unbound code = {code}")
     elif es.thread_host == common.ES_worker_thread:
         print("**** handle trap in worker thread")
         print("emworker: relinquish control on a trap")
         es.ab.write_scb(es, es.ab.SCB_STATUS, es.ab.SCB_RELINQUISH)
+        es.halt_reason = "relinquish"
         print(f"trap relinquish before fixup, pc = {es.pc.get()}")
         es.pc.put(limit_address(es, es.ab.read_scb(es, es.ab.SCB_CUR_INSTR_ADDR)))
         print(f"trap relinquish after fixup, pc = {es.pc.get()}")
@@ -680,11 +781,11 @@ def trap_read(es):
     a = es.regfile[es.ir_a].get() # buffer address
     b = es.regfile[es.ir_b].get() # buffer size
     
-    # Convert input string to character codes and store in memory
-    chars_read = 0
-    for char_code in input_str[:b]: # Read up to 'b' characters
-        es.ab.write_mem16(es, a + chars_read, ord(char_code))
-        chars_read += 1
+    # Convert input string to character codes and store in memory,
+    # reading up to 'b' characters
+    codes = [ord(c) for c in input_str[:b]]
+    es.ab.write_mem16_block(es, a, codes)
+    chars_read = len(codes)
     
     es.regfile[es.ir_a].put(a + chars_read) # Address after last word stored
     es.regfile[es.ir_b].put(chars_read) # Number of characters read
@@ -697,9 +798,10 @@ def trap_write(es):
     a = es.regfile[es.ir_a].get() # buffer address
     b = es.regfile[es.ir_b].get() # buffer size
     
-    output_str = ""
-    for i in range(b):
-        output_str += chr(mem_fetch_data(es, a + i))
+    words = es.ab.read_mem16_block(es, a, b)
+    if es.trace_enabled:
+        es.copyable["memFetchDataLog"].extend(zip(range(a, a + b), words))
+    output_str = "".join(map(chr, words))
     
     es.io_log_buffer += output_str
     refresh_io_log_buffer(es)
@@ -715,19 +817,23 @@ def handle_rx(es):
 
 def handle_exp(es):
     es.instr_fmt_str = "EXP"
-    code = 16 * es.ir_a + es.ir_b
+    code = (es.ir_a << 4) | es.ir_b
     if code < limit_exp_code:
         common.mode.devlog(f"dispatching EXP code={code} d={es.ir_d}")
-        dispatch_exp[code](es)
+        es.instr_op_str = arch.mnemonicEXP[code]
+        es.adr.put(es.instr_disp)
+        dispatch_exp[code](es, es.exp_fields)
     else:
         common.mode.devlog(f"EXP bad code {arith.word_to_hex4(code)}")
 
-def exp2_push(es):
+def exp2_push(es, d):
     x = es.regfile[es.ir_d].get()
-    re = es.field_e
+    re = d.e
+    rf = d.f
     top = es.regfile[re].get()
-    limit = es.regfile[es.field_f].get()
-    print(f"push x={x} re={re} top={top} limit={limit}")
+    limit = es.regfile[rf].get()
+    if DEBUG:
+        common.mode.devlog(f"push x={x} re={re} top={top} limit={limit}")
     if top < limit:
         top += 1
         es.regfile[re].put(top)
@@ -738,21 +844,21 @@ def exp2_push(es):
         arch.set_bit_in_reg_le(es.regfile[15], arch.bit_ccS)
         arch.set_bit_in_reg_le(es.req, arch.stack_overflow_bit)
 
-def exp2_pop(es):
-    re = es.field_e
+def exp2_pop(es, d):
+    re, rf = d.e, d.f
     top = es.regfile[re].get()
-    base = es.regfile[es.field_f].get()
+    base = es.regfile[rf].get()
     if top >= base:
         es.regfile[es.ir_d].put(mem_fetch_data(es, top))
         top -= 1
-        es.regfile[es.field_e].put(top)
+        es.regfile[re].put(top)
     else:
         print("pop: stack underflow")
         es.regfile[15].put(0)
         arch.set_bit_in_reg_le(es.regfile[15], arch.bit_ccs)
         arch.set_bit_in_reg_le(es.req, arch.stack_underflow_bit)
 
-def exp2_top(es):
+def exp2_top(es, d):
     a = es.regfile[es.ir_a].get()
     b = es.regfile[es.ir_b].get()
     if a >= b:
@@ -761,7 +867,7 @@ def exp2_top(es):
         common.mode.devlog("pop: stack underflow")
         # arith.set_bit_in_reg_le(es.req, arch.stack_underflow_bit) # req is not a register
 
-dispatch_primary_opcode = [
+dispatch_primary_opcode = (
     cab_dc(arith.op_add),    # 0
     cab_dc(arith.op_sub),    # 1
     cab_dc(arith.op_mul),    # 2
@@ -778,17 +884,13 @@ dispatch_primary_opcode = [
     nop,                     # d
     handle_exp,              # e
     handle_rx                # f
-]
+)
 
 def rx(f):
     def inner(es):
         common.mode.devlog('rx')
         es.instr_op_str = arch.mnemonicRX[es.ir_b]
-        es.instr_disp = mem_fetch_instr(es, es.pc.get())
-        es.next_instr_addr = arith.bin_add(es.next_instr_addr, 1)
-        es.pc.put(limit_address(es, es.next_instr_addr))
-        es.ab.write_scb(es, es.ab.SCB_NEXT_INSTR_ADDR, es.next_instr_addr)
-        es.ea = arith.bin_add(es.regfile[es.ir_a].get(), es.instr_disp)
+        es.ea = (es.regfile[es.ir_a].get() + es.instr_disp) & 0xFFFF
         es.instr_ea = es.ea
         es.adr.put(es.instr_ea)
         common.mode.devlog(f"rx ea, disp={arith.word_to_hex4(es.instr_disp)}")
@@ -812,33 +914,33 @@ def rx_store(es):
 def rx_jump(es):
     common.mode.devlog('rx_jump')
     es.next_instr_addr = es.ea
-    es.pc.put(limit_address(es, es.next_instr_addr))
+    es.pc.put(es.ea & es.address_mask)
 
 def rx_jumpc0(es):
     common.mode.devlog('rx_jumpc0')
     cc = es.regfile[15].get()
-    if arch.get_bit_in_word_le(cc, es.ir_d) == 0:
+    if (cc >> es.ir_d) & 1 == 0:
         es.next_instr_addr = es.ea
-        es.pc.put(limit_address(es, es.next_instr_addr))
+        es.pc.put(es.ea & es.address_mask)
 
 def rx_jumpc1(es):
     common.mode.devlog('rx_jumpc1')
     cc = es.regfile[15].get()
-    if arch.get_bit_in_word_le(cc, es.ir_d) == 1:
+    if (cc >> es.ir_d) & 1 == 1:
         es.next_instr_addr = es.ea
-        es.pc.put(limit_address(es, es.next_instr_addr))
+        es.pc.put(es.ea & es.address_mask)
 
 def rx_jumpz(es):
     common.mode.devlog('rx_jumpz')
     if es.regfile[es.ir_d].get() == 0:
         es.next_instr_addr = es.ea
-        es.pc.put(limit_address(es, es.next_instr_addr))
+        es.pc.put(es.ea & es.address_mask)
 
 def rx_jumpnz(es):
     common.mode.devlog('rx_jumpnz')
     if es.regfile[es.ir_d].get() != 0:
         es.next_instr_addr = es.ea
-        es.pc.put(limit_address(es, es.next_instr_addr))
+        es.pc.put(es.ea & es.address_mask)
 
 def rx_testset(es):
     common.mode.devlog('testset')
@@ -849,12 +951,12 @@ def rx_jal(es):
     common.mode.devlog('rx_jal')
     es.regfile[es.ir_d].put(es.pc.get())
     es.next_instr_addr = es.ea
-    es.pc.put(limit_address(es, es.next_instr_addr))
+    es.pc.put(es.ea & es.address_mask)
 
 def rx_nop(es):
     common.mode.devlog('rx_nop')
 
-dispatch_rx = [
+dispatch_rx = (
     rx(rx_lea),       # 0
     rx(rx_load),      # 1
     rx(rx_store),     # 2
@@ -871,350 +973,361 @@ dispatch_rx = [
     rx(rx_nop),       # d
     rx(rx_nop),       # e
     rx(rx_nop)        # f
-]
-
-def exp2(f):
-    def inner(es):
-        common.mode.devlog('>>> EXP instruction')
-        exp_code = 16 * es.ir_a + es.ir_b
-        es.instr_op_str = arch.mnemonicEXP[exp_code]
-        es.instr_disp = mem_fetch_instr(es, es.pc.get())
-        es.adr.put(es.instr_disp)
-        es.next_instr_addr = arith.bin_add(es.next_instr_addr, 1)
-        es.pc.put(limit_address(es, es.next_instr_addr))
-        es.ab.write_scb(es, es.ab.SCB_NEXT_INSTR_ADDR, es.next_instr_addr)
-        temp_instr = es.instr_disp
-        es.field_gh = temp_instr & 0x00FF
-        es.field_h = temp_instr & 0x000F
-        temp_instr >>= 4
-        es.field_g = temp_instr & 0x000F
-        temp_instr >>= 4
-        es.field_f = temp_instr & 0x000F
-        temp_instr >>= 4
-        es.field_e = temp_instr & 0x000F
-        f(es)
-    return inner
-
-def exp2_nop(es):
-    common.mode.devlog('exp2_nop')
-
-def exp2_brf(es):
-    common.mode.devlog('exp_brf')
-    es.pc.put(limit_address(es, es.pc.get() + es.adr.get()))
-
-def exp2_brb(es):
-    common.mode.devlog('exp_brb')
-    es.pc.put(limit_address(es, es.pc.get() - es.adr.get()))
-
-def exp2_brfz(es):
-    common.mode.devlog('exp_brf')
+)
+
+# The second word of an EXP instruction decodes to the fields
+# (e, f, g, h, gh), which are passed to the EXP handler as d. Loops
+# execute the same words repeatedly, so the decoded fields are cached
+# by word.
+
+DecodedExp = collections.namedtuple("DecodedExp", "e f g h gh")
+
+@functools.lru_cache(maxsize=4096)
+def decode_exp_fields(disp):
+    return DecodedExp((disp >> 12) & 0x000F,
+                      (disp >> 8) & 0x000F,
+                      (disp >> 4) & 0x000F,
+                      disp & 0x000F,
+                      disp & 0x00FF)
+
+def exp2_nop(es, d):
+    if DEBUG:
+        common.mode.devlog('exp2_nop')
+
+def exp2_brf(es, d):
+    if DEBUG:
+        common.mode.devlog('exp_brf')
+    es.pc.put((es.pc.get() + es.adr.get()) & mem_mask)
+
+def exp2_brb(es, d):
+    if DEBUG:
+        common.mode.devlog('exp_brb')
+    es.pc.put((es.pc.get() - es.adr.get()) & mem_mask)
+
+def exp2_brfz(es, d):
+    if DEBUG:
+        common.mode.devlog('exp_brfz')
     x = es.regfile[es.ir_d].get()
     if x == 0:
-        es.pc.put(limit_address(es, es.pc.get() + es.adr.get()))
-        print("brfz is branching")
-    else:
-        print("brfz is not branching")
-
-def exp2_brbz(es):
-    common.mode.devlog('exp_brb')
+        es.pc.put((es.pc.get() + es.adr.get()) & mem_mask)
+        if DEBUG:
+            common.mode.devlog("brfz is branching")
+    elif DEBUG:
+        common.mode.devlog("brfz is not branching")
+
+def exp2_brbz(es, d):
+    if DEBUG:
+        common.mode.devlog('exp_brbz')
     x = es.regfile[es.ir_d].get()
     if x == 0:
-        es.pc.put(limit_address(es, es.pc.get() - es.adr.get()))
-        print("brbz is branching")
-    else:
-        print("brbz is not branching")
-
-def exp2_brfnz(es):
-    common.mode.devlog('exp_brfnz')
+        es.pc.put((es.pc.get() - es.adr.get()) & mem_mask)
+        if DEBUG:
+            common.mode.devlog("brbz is branching")
+    elif DEBUG:
+        common.mode.devlog("brbz is not branching")
+
+def exp2_brfnz(es, d):
+    if DEBUG:
+        common.mode.devlog('exp_brfnz')
     x = es.regfile[es.ir_d].get()
     if x != 0:
-        es.pc.put(limit_address(es, es.pc.get() + es.adr.get()))
-        print("brfnz is branching")
-    else:
-        print("brfnz is not branching")
-
-def exp2_brbnz(es):
-    common.mode.devlog('exp_brbnz')
+        es.pc.put((es.pc.get() + es.adr.get()) & mem_mask)
+        if DEBUG:
+            common.mode.devlog("brfnz is branching")
+    elif DEBUG:
+        common.mode.devlog("brfnz is not branching")
+
+def exp2_brbnz(es, d):
+    if DEBUG:
+        common.mode.devlog('exp_brbnz')
     x = es.regfile[es.ir_d].get()
     if x != 0:
-        es.pc.put(limit_address(es, es.pc.get() - es.adr.get()))
-        print("brbnz is branching")
-    else:
-        print("brbnz is not branching")
-
-def exp2_brfc0(es):
-    common.mode.devlog('exp_brfc0')
-    x = es.regfile[es.ir_d].get()
-    bit_idx = es.field_e
-    b = arch.get_bit_in_word_le(x, bit_idx)
-    offset = es.instr_disp & 0x0FFF
-    print(f"brfc0 x={x} bit_idx={bit_idx} b={b}")
-    if b == 0:
-        es.pc.put(limit_address(es, es.pc.get() + offset))
-        print("brfc0 is branching")
-    else:
-        print("brfc0 is not branching")
-
-def exp2_brbc0(es):
-    common.mode.devlog('exp_brbc0')
-    x = es.regfile[es.ir_d].get()
-    bit_idx = es.field_e
-    b = arch.get_bit_in_word_le(x, bit_idx)
-    offset = es.instr_disp & 0x0FFF
-    print(f"brbc0 x={x} bit_idx={bit_idx} b={b}")
-    if b == 0:
-        es.pc.put(limit_address(es, es.pc.get() - offset))
-        print("brbc0 is branching")
-    else:
-        print("brbc0 is not branching")
-
-def exp2_brfc1(es):
-    common.mode.devlog('exp_brfc1')
-    x = es.regfile[es.ir_d].get()
-    bit_idx = es.field_e
-    b = arch.get_bit_in_word_le(x, bit_idx)
-    offset = es.instr_disp & 0x0FFF
-    print(f"brfc1 x={x} bit_idx={bit_idx} b={b}")
-    if b != 0:
-        es.pc.put(limit_address(es, es.pc.get() + offset))
-        print("brfc1 is branching")
-    else:
-        print("brfc1 is not branching")
+        es.pc.put((es.pc.get() - es.adr.get()) & mem_mask)
+        if DEBUG:
+            common.mode.devlog("brbnz is branching")
+    elif DEBUG:
+        common.mode.devlog("brbnz is not branching")
+
+# The branch-on-bit instructions test bit e of Rd and branch forward
+# (sign 1) or backward (sign -1) by the 12-bit offset when the bit
+# equals want
+
+def branch_on_bit(name, sign, want):
+    def inner(es, d):
+        if DEBUG:
+            common.mode.devlog(f"exp_{name}")
+        x = es.regfile[es.ir_d].get()
+        b = (x >> d.e) & 1
+        if DEBUG:
+            common.mode.devlog(f"{name} x={x} bit_idx={d.e} b={b}")
+        if b == want:
+            offset = es.instr_disp & 0x0FFF
+            es.pc.put((es.pc.get() + sign * offset) & mem_mask)
+            if DEBUG:
+                common.mode.devlog(f"{name} is branching")
+        elif DEBUG:
+            common.mode.devlog(f"{name} is not branching")
+    return inner
 
-def exp2_brbc1(es):
-    common.mode.devlog('exp_brbc1')
-    x = es.regfile[es.ir_d].get()
-    bit_idx = es.field_e
-    b = arch.get_bit_in_word_le(x, bit_idx)
-    offset = es.instr_disp & 0x0FFF
-    if b != 0:
-        es.pc.put(limit_address(es, es.pc.get() - offset))
-        print("brbc1 is branching")
-    else:
-        print("brbc1 is not branching")
+exp2_brfc0 = branch_on_bit("brfc0", 1, 0)
+exp2_brbc0 = branch_on_bit("brbc0", -1, 0)
+exp2_brfc1 = branch_on_bit("brfc1", 1, 1)
+exp2_brbc1 = branch_on_bit("brbc1", -1, 1)
+exp2_brc0 = branch_on_bit("brc0", 1, 0)
+exp2_brc1 = branch_on_bit("brc1", 1, 1)
 
-def exp2_resume(es):
-    print('exp2_resume')
+def exp2_resume(es, d):
+    if DEBUG:
+        common.mode.devlog('exp2_resume')
     es.status_reg.put(es.rstat.get())
-    es.pc.put(limit_address(es, es.rpc.get()))
+    es.pc.put(es.rpc.get() & mem_mask)
     es.ir.put(es.iir.get())
     es.adr.put(es.iadr.get())
 
-def exp2_timeron(es):
-    print('exp2_timeron')
+def exp2_timeron(es, d):
+    if DEBUG:
+        common.mode.devlog('exp2_timeron')
     x = es.regfile[es.ir_d].get()
     timer_start(es, x)
 
-def exp2_timeroff(es):
-    print('exp2_timeroff')
+def exp2_timeroff(es, d):
+    if DEBUG:
+        common.mode.devlog('exp2_timeroff')
     timer_stop(es)
 
-def exp2_dispatch(es):
-    common.mode.devlog('exp_dsptch')
+def exp2_dispatch(es, d):
+    if DEBUG:
+        common.mode.devlog('exp_dsptch')
     code = es.regfile[es.ir_d].get()
     limit = es.adr.get()
     here = es.pc.get()
-    offset = code if code < limit else limit
+    offset = min(code, limit)
     loc = here + offset
     dest = mem_fetch_data(es, loc)
-    es.pc.put(limit_address(es, dest))
+    es.pc.put(dest & mem_mask)
 
-def exp2_save(es):
+def exp2_save(es, d):
     r_start = es.ir_d
-    r_end = es.field_e
-    index = es.regfile[es.field_f].get()
-    offset = es.field_gh
+    r_end = d.e
+    index = es.regfile[d.f].get()
+    offset = d.gh
     ea = index + offset
-    common.mode.devlog(f"save regs = {r_start}..{r_end} index={index}" \
-                       f" offset={offset} ea={arith.word_to_hex4(ea)}")
-    sr_looper(lambda a, r: mem_store(es, a, es.regfile[r].get()), ea, r_start, r_end)
-
-def exp2_restore(es):
-    common.mode.devlog('exp2_restore')
+    if DEBUG:
+        common.mode.devlog(f"save regs = {r_start}..{r_end} index={index}" \
+                           f" offset={offset} ea={arith.word_to_hex4(ea)}")
+    vec16 = es.vec16
+    rbase = es.ab.REG_OFFSET16
+    xs = []
+    for lo, hi in sr_reg_ranges(r_start, r_end):
+        xs += vec16[rbase + 2 * lo : rbase + 2 * hi : 2]
+    mbase = es.ab.MEM_OFFSET16 + ea
+    vec16[mbase : mbase + len(xs)] = xs
+    es.dirty_addrs.update(range(ea, ea + len(xs)))
+    if es.trace_enabled:
+        regs = sr_reg_numbers(r_start, r_end)
+        addrs = range(ea, ea + len(xs))
+        es.copyable["regFetched"].extend(zip(regs, xs))
+        es.copyable["memStoreLog"].extend(zip(addrs, xs))
+        es.instr_effect.extend(["M", a, x] for a, x in zip(addrs, xs))
+
+def exp2_restore(es, d):
+    if DEBUG:
+        common.mode.devlog('exp2_restore')
     r_start = es.ir_d
-    r_end = es.field_e
-    index = es.regfile[es.field_f].get()
-    offset = es.field_gh
+    r_end = d.e
+    index = es.regfile[d.f].get()
+    offset = d.gh
     ea = index + offset
-    common.mode.devlog(f"restore regs = {r_start}..{r_end} index={index}" \
-                       f" offset={offset} ea={arith.word_to_hex4(ea)}")
-    sr_looper(lambda a, r: es.regfile[r].put(mem_fetch_data(es, a)), ea, r_start, r_end)
-
-def sr_looper(f, addr, first, last):
-    done = False
-    r = first
-    while not done:
-        common.mode.devlog(f"save looper addr={addr} r={r}")
-        f(addr, r)
-        done = r == last
-        addr += 1
-        r = bin_inc4(r)
+    if DEBUG:
+        common.mode.devlog(f"restore regs = {r_start}..{r_end} index={index}" \
+                           f" offset={offset} ea={arith.word_to_hex4(ea)}")
+    vec16 = es.vec16
+    rbase = es.ab.REG_OFFSET16
+    n = ((r_end - r_start) & 0x000F) + 1
+    mbase = es.ab.MEM_OFFSET16 + ea
+    xs = vec16[mbase : mbase + n]
+    i = 0
+    for lo, hi in sr_reg_ranges(r_start, r_end):
+        vec16[rbase + 2 * lo : rbase + 2 * hi : 2] = xs[i : i + hi - lo]
+        i += hi - lo
+    vec16[rbase] = 0 # R0 stays 0 even if it was in the range
+    if es.trace_enabled:
+        regs = sr_reg_numbers(r_start, r_end)
+        es.copyable["memFetchDataLog"].extend(zip(range(ea, ea + n), xs))
+        es.copyable["regStored"].extend(zip(regs, xs))
+        es.copyable["regStoredLast"].update(zip(regs, xs))
+
+# Save and restore cover registers r_start..r_end, wrapping around from
+# R15 to R0; the range is one or two contiguous runs of registers
+
+def sr_reg_ranges(r_start, r_end):
+    if r_start <= r_end:
+        return ((r_start, r_end + 1),)
+    return ((r_start, 16), (0, r_end + 1))
+
+def sr_reg_numbers(r_start, r_end):
+    return [r for lo, hi in sr_reg_ranges(r_start, r_end) for r in range(lo, hi)]
 
 def bin_inc4(x):
-    return 0 if x >= 15 else x + 1
+    return (x + 1) & 0x000F
 
-def exp2_getctl(es):
-    common.mode.devlog('exp2_getctl')
-    cregn = es.field_f
+def exp2_getctl(es, d):
+    if DEBUG:
+        common.mode.devlog('exp2_getctl')
+    cregn = d.f
     creg_idx = cregn + ctl_reg_index_offset
-    common.mode.devlog(f"exp2_getctl cregn={cregn} creg_idx={creg_idx}")
-    es.regfile[es.field_e].put(es.register[creg_idx].get())
-
-def exp2_putctl(es):
-    common.mode.devlog('putctl')
-    cregn = es.field_f
+    if DEBUG:
+        common.mode.devlog(f"exp2_getctl cregn={cregn} creg_idx={creg_idx}")
+    es.regfile[d.e].put(es.register[creg_idx].get())
+
+def exp2_putctl(es, d):
+    if DEBUG:
+        common.mode.devlog('putctl')
+    cregn = d.f
     creg_idx = cregn + ctl_reg_index_offset
-    common.mode.devlog(f"putctl src e=={es.field_e} val={es.regfile[es.field_e].get()}")
-    common.mode.devlog(f"putctl dest f={es.field_f} cregn={cregn} creg_idx={creg_idx}")
-    es.register[creg_idx].put(es.regfile[es.field_e].get())
+    if DEBUG:
+        common.mode.devlog(f"putctl src e=={d.e} val={es.regfile[d.e].get()}")
+        common.mode.devlog(f"putctl dest f={d.f} cregn={cregn} creg_idx={creg_idx}")
+    es.register[creg_idx].put(es.regfile[d.e].get())
     es.register[creg_idx].refresh() # Placeholder
 
-def exp2_execute(es):
-    common.mode.devlog("exp2_execute")
-
-def exp2_shiftl(es):
-    common.mode.devlog(f"shiftl d={arith.word_to_hex4(es.ir_d)}" \
-                       f" e={arith.word_to_hex4(es.field_e)}" \
-                       f" gh={arith.word_to_hex4(es.field_gh)}")
-    x = es.regfile[es.field_e].get()
-    k = es.field_gh
+def exp2_execute(es, d):
+    if DEBUG:
+        common.mode.devlog("exp2_execute")
+
+def exp2_shiftl(es, d):
+    if DEBUG:
+        common.mode.devlog(f"shiftl d={arith.word_to_hex4(es.ir_d)}" \
+                           f" e={arith.word_to_hex4(d.e)}" \
+                           f" gh={arith.word_to_hex4(d.gh)}")
+    x = es.regfile[d.e].get()
+    k = d.gh
     result = arith.shift_l(x, k)
-    print(f"shiftl x={arith.word_to_hex4(x)} k={k} result={arith.word_to_hex4(result)}")
+    if DEBUG:
+        common.mode.devlog(f"shiftl x={arith.word_to_hex4(x)} k={k} result={arith.word_to_hex4(result)}")
     es.regfile[es.ir_d].put(result)
 
-def exp2_shiftr(es):
-    common.mode.devlog(f"shiftr d={arith.word_to_hex4(es.ir_d)}" \
-                       f" e={arith.word_to_hex4(es.field_e)}" \
-                       f" gh={arith.word_to_hex4(es.field_gh)}")
-    x = es.regfile[es.field_e].get()
-    k = es.field_gh
+def exp2_shiftr(es, d):
+    if DEBUG:
+        common.mode.devlog(f"shiftr d={arith.word_to_hex4(es.ir_d)}" \
+                           f" e={arith.word_to_hex4(d.e)}" \
+                           f" gh={arith.word_to_hex4(d.gh)}")
+    x = es.regfile[d.e].get()
+    k = d.gh
     result = arith.shift_r(x, k)
-    print(f"shiftr x={arith.word_to_hex4(x)} k={k} result={arith.word_to_hex4(result)}")
+    if DEBUG:
+        common.mode.devlog(f"shiftr x={arith.word_to_hex4(x)} k={k} result={arith.word_to_hex4(result)}")
     es.regfile[es.ir_d].put(result)
 
-def exp2_extract(es):
-    print('exp2_extract')
+def exp2_extract(es, d):
+    if DEBUG:
+        common.mode.devlog('exp2_extract')
     d_old = es.regfile[es.ir_d].get()
-    src = es.regfile[es.field_e].get()
-    dest_right = es.field_f
-    src_right = es.field_g
-    src_left = es.field_h
+    src = es.regfile[d.e].get()
+    dest_right = d.f
+    src_right = d.g
+    src_left = d.h
     d_new = arith.calculate_extract(16, 0xFFFF, d_old, src,\
                                     dest_right,\
                                     src_right, src_left)
-    print(f"extract " \
-          f" d_old = {arith.word_to_hex4(d_old)}" \
-          f" src = {arith.word_to_hex4(src)}" \
-          f" dest_right = {dest_right}" \
-          f" src_right = {src_right}" \
-          f" src_left = {src_left}" \
-          f" d_new = {arith.word_to_hex4(d_new)}")
+    if DEBUG:
+        common.mode.devlog(f"extract " \
+                           f" d_old = {arith.word_to_hex4(d_old)}" \
+                           f" src = {arith.word_to_hex4(src)}" \
+                           f" dest_right = {dest_right}" \
+                           f" src_right = {src_right}" \
+                           f" src_left = {src_left}" \
+                           f" d_new = {arith.word_to_hex4(d_new)}")
     es.regfile[es.ir_d].put(d_new)
 
-def exp2_logicf(es):
-    common.mode.devlog('EXP logicf')
-    print("************* logicf")
+def exp2_logicf(es, d):
+    if DEBUG:
+        common.mode.devlog('EXP logicf')
+        common.mode.devlog("************* logicf")
     x = es.regfile[es.ir_d].get()
-    y = es.regfile[es.field_e].get()
-    idx1 = es.field_f
-    idx2 = es.field_g
-    fcn = es.field_h
+    y = es.regfile[d.e].get()
+    idx1 = d.f
+    idx2 = d.g
+    fcn = d.h
     result = arith.apply_logic_fcn_field(fcn, x, y, idx1, idx2)
-    print(f"logicf x={arith.word_to_hex4(x)} y={arith.word_to_hex4(y)} result={arith.word_to_hex4(result)}")
+    if DEBUG:
+        common.mode.devlog(f"logicf x={arith.word_to_hex4(x)} y={arith.word_to_hex4(y)} result={arith.word_to_hex4(result)}")
     es.regfile[es.ir_d].put(result)
 
-def exp2_logicb(es):
-    common.mode.devlog('EXP logicb')
+def exp2_logicb(es, d):
+    if DEBUG:
+        common.mode.devlog('EXP logicb')
     w1 = es.regfile[es.ir_d].get()
-    w2 = es.regfile[es.field_e].get()
-    x = arch.get_bit_in_word_le(w1, es.field_f)
-    y = arch.get_bit_in_word_le(w2, es.field_g)
-    fcn = es.field_h
+    w2 = es.regfile[d.e].get()
+    i = d.f
+    x = (w1 >> i) & 1
+    y = (w2 >> d.g) & 1
+    fcn = d.h
     bresult = arith.apply_logic_fcn_bit(fcn, x, y)
-    wresult = arch.put_bit_in_word_le(16, w1, es.field_f, bresult)
-    print(f"logicb w1={arith.word_to_hex4(w1)} x={x} y={y} fcn={fcn} bresult={bresult} wresult={arith.word_to_hex4(wresult)}")
+    wresult = (w1 & ~(1 << i)) | (bresult << i)
+    if DEBUG:
+        common.mode.devlog(f"logicb w1={arith.word_to_hex4(w1)} x={x} y={y} fcn={fcn} bresult={bresult} wresult={arith.word_to_hex4(wresult)}")
     es.regfile[es.ir_d].put(wresult)
 
-def exp2_logicu(es):
-    common.mode.devlog('EXP logicu')
+def exp2_logicu(es, d):
+    if DEBUG:
+        common.mode.devlog('EXP logicu')
     regx = es.regfile[es.ir_d].get()
-    bitx = arith.extract_bit(regx, es.field_e)
-    regy = es.regfile[es.field_f].get()
-    bity = arith.extract_bit(regy, es.field_g)
-    fcn = es.field_h
+    bitx = arith.extract_bit(regx, d.e)
+    regy = es.regfile[d.f].get()
+    bity = arith.extract_bit(regy, d.g)
+    fcn = d.h
     bresult = arith.apply_logic_fcn_bit(fcn, bitx, bity)
-    wresult = arith.set_bit(regx, es.field_e, bresult)
+    wresult = arith.set_bit(regx, d.e, bresult)
     es.regfile[es.ir_d].put(wresult)
 
-def exp2_brc0(es):
-    common.mode.devlog('exp_brc0')
-    x = es.regfile[es.ir_d].get()
-    bit_idx = es.field_e
-    b = arch.get_bit_in_word_le(x, bit_idx)
-    offset = es.instr_disp & 0x0FFF
-    print(f"brfc0 x={x} bit_idx={bit_idx} b={b}")
-    if b == 0:
-        es.pc.put(limit_address(es, es.pc.get() + offset))
-        print("brfc0 is branching")
-    else:
-        print("brfc0 is not branching")
-
-def exp2_brc1(es):
-    common.mode.devlog('exp_brc1')
-    x = es.regfile[es.ir_d].get()
-    bit_idx = es.field_e
-    b = arch.get_bit_in_word_le(x, bit_idx)
-    offset = es.instr_disp & 0x0FFF
-    print(f"brfc0 x={x} bit_idx={bit_idx} b={b}")
-    if b == 0:
-        es.pc.put(limit_address(es, es.pc.get() + offset))
-        print("brfc0 is branching")
-    else:
-        print("brfc0 is not branching")
-
-def exp2_brz(es):
-    common.mode.devlog('exp_brz')
+def exp2_brz(es, d):
+    if DEBUG:
+        common.mode.devlog('exp_brz')
     x = es.regfile[es.ir_d].get()
     if x == 0:
-        es.pc.put(limit_address(es, es.pc.get() + es.adr.get()))
-        print("brfz is branching")
-    else:
-        print("brfz is not branching")
-
-def exp2_brnz(es):
-    common.mode.devlog('exp_brnz')
+        es.pc.put((es.pc.get() + es.adr.get()) & mem_mask)
+        if DEBUG:
+            common.mode.devlog("brfz is branching")
+    elif DEBUG:
+        common.mode.devlog("brfz is not branching")
+
+def exp2_brnz(es, d):
+    if DEBUG:
+        common.mode.devlog('exp_brnz')
     x = es.regfile[es.ir_d].get()
     if x == 0:
-        es.pc.put(limit_address(es, es.pc.get() + es.adr.get()))
-        print("brfz is branching")
-    else:
-        print("brfz is not branching")
-
-dispatch_exp = [
-    exp2(exp2_logicf),   # 00
-    exp2(exp2_logicb),   # 01
-    exp2(exp2_logicu),   # 02
-    exp2(exp2_shiftl),   # 03
-    exp2(exp2_shiftr),   # 04
-    exp2(exp2_extract),  # 05
-    exp2(exp2_nop),      # 06
-    exp2(exp2_push),     # 07
-    exp2(exp2_pop),      # 08
-    exp2(exp2_top),      # 09
-    exp2(exp2_save),     # 0a
-    exp2(exp2_restore),  # 0b
-    exp2(exp2_brc0),     # 0c
-    exp2(exp2_brc1),     # 0d
-    exp2(exp2_brz),      # 0e
-    exp2(exp2_brnz),     # 0f
-    exp2(exp2_dispatch), # 10
-    exp2(exp2_getctl),   # 11
-    exp2(exp2_putctl),   # 12
-    exp2(exp2_resume),   # 13
-    exp2(exp2_timeron),  # 14
-    exp2(exp2_timeroff), # 15
-    exp2(exp2_add32)     # 16
-]
+        es.pc.put((es.pc.get() + es.adr.get()) & mem_mask)
+        if DEBUG:
+            common.mode.devlog("brfz is branching")
+    elif DEBUG:
+        common.mode.devlog("brfz is not branching")
+
+dispatch_exp = (
+    exp2_logicf,    # 00
+    exp2_logicb,    # 01
+    exp2_logicu,    # 02
+    exp2_shiftl,    # 03
+    exp2_shiftr,    # 04
+    exp2_extract,   # 05
+    exp2_nop,       # 06
+    exp2_push,      # 07
+    exp2_pop,       # 08
+    exp2_top,       # 09
+    exp2_save,      # 0a
+    exp2_restore,   # 0b
+    exp2_brc0,      # 0c
+    exp2_brc1,      # 0d
+    exp2_brz,       # 0e
+    exp2_brnz,      # 0f
+    exp2_dispatch,  # 10
+    exp2_getctl,    # 11
+    exp2_putctl,    # 12
+    exp2_resume,    # 13
+    exp2_timeron,   # 14
+    exp2_timeroff,  # 15
+    exp2_add32      # 16
+)
 
 limit_exp_code = len(dispatch_exp)
 
@@ -1226,24 +1339,25 @@ def parse_copy_object_module_to_memory(es, om):
     common.mode.devlog(f"parse_copy_object_module_to_memory {om.mod_name}")
     current_address = 0
     for x in om.obj_lines:
-        fields = st.parse_obj_line(x)
-        if fields["operation"] == "data":
-            for val_str in fields["operands"]:
-                val = arith.hex4_to_word(val_str)
-                es.ab.write_mem16(es, current_address, val)
-                current_address += 1
-        elif fields["operation"] == "org":
-            current_address = arith.hex4_to_word(fields["operands"][0])
-        elif fields["operation"] == "module":
+        if not x or x.isspace(): # Blank lines carry nothing to load
+            continue
+        op, operands = st.parse_obj_line(x)
+        if op == "data":
+            words = [arith.hex4_to_word(val_str) for val_str in operands]
+            es.ab.write_mem16_block(es, current_address, words)
+            current_address += len(words)
+        elif op == "org":
+            current_address = arith.hex4_to_word(operands[0])
+        elif op == "module":
             pass # ignore
-        elif fields["operation"] == "relocate":
+        elif op == "relocate":
             pass # ignore, already handled by linker
-        elif fields["operation"] == "import":
+        elif op == "import":
             pass # ignore, already handled by linker
-        elif fields["operation"] == "export":
+        elif op == "export":
             pass # ignore, already handled by linker
         else:
-            common.mode.devlog(f"parse_copy_object_module_to_memory: unknown operation {fields["operation"]}")
+            common.mode.devlog(f"parse_copy_object_module_to_memory: unknown operation {op}")
 
 def boot(es, obj_md):
     common.mode.devlog('em.boot')
@@ -1253,6 +1367,7 @@ def boot(es, obj_md):
     parse_copy_object_module_to_memory(es, obj_md)
     
     es.ab.write_scb(es, es.ab.SCB_STATUS, es.ab.SCB_READY)
+    es.halt_reason = None
     es.pc.put(0) # Set program counter to 0
     es.next_instr_addr = 0
     es.cur_instr_addr = 0
@@ -1262,28 +1377,31 @@ def boot(es, obj_md):
 # Debugging/Output functions
 # -------------------------------------------------------------------------
 
+control_reg_names = {
+    'pc': 'Program Counter', 'ir': 'Instruction Register',
+    'adr': 'Address Register', 'dat': 'Data Register',
+    'status_reg': 'Status Register', 'mask': 'Mask Register',
+    'req': 'Request Register', 'rstat': 'Return Status Register',
+    'rpc': 'Return Program Counter', 'iir': 'Interrupt Instruction Register',
+    'iadr': 'Interrupt Address Register', 'vect': 'Vector Register',
+    'bpseg': 'Base Program Segment', 'epseg': 'End Program Segment',
+    'bdseg': 'Base Data Segment', 'edseg': 'End Data Segment'
+}
+
+def show_reg_value(prefix, x):
+    return f"{prefix}{arith.word_to_hex4(x)} ({x})"
+
 def dump_registers(es):
     print("\n--- Registers ---")
     # Print general purpose registers (R0-R15)
-    for i in range(16):
-        reg = es.regfile[i]
-        print(f"{reg.reg_name}: {arith.word_to_hex4(reg.get())} ({reg.get()})")
+    print("\n".join(show_reg_value(reg.dump_prefix, reg.get()) for reg in es.regfile))
 
     # Print control registers
     print("\n--- Control Registers ---")
-    control_reg_names = {
-        'pc': 'Program Counter', 'ir': 'Instruction Register',
-        'adr': 'Address Register', 'dat': 'Data Register',
-        'status_reg': 'Status Register', 'mask': 'Mask Register',
-        'req': 'Request Register', 'rstat': 'Return Status Register',
-        'rpc': 'Return Program Counter', 'iir': 'Interrupt Instruction Register',
-        'iadr': 'Interrupt Address Register', 'vect': 'Vector Register',
-        'bpseg': 'Base Program Segment', 'epseg': 'End Program Segment',
-        'bdseg': 'Base Data Segment', 'edseg': 'End Data Segment'
-    }
-    for reg in es.control_registers:
-        if reg.reg_name in control_reg_names:
-            print(f"{control_reg_names[reg.reg_name]} ({reg.reg_name}): {arith.word_to_hex4(reg.get())} ({reg.get()})")
+    lines = [show_reg_value(f"{control_reg_names[reg.reg_name]} ({reg.reg_name}): ", reg.get())
+             for reg in es.control_registers if reg.reg_name in control_reg_names]
+    if lines:
+        print("\n".join(lines))
     print("-----------------")
 
 def dump_memory(es, start_addr=0, end_addr=arch.mem_size):
@@ -1303,10 +1421,8 @@ def dump_memory(es, start_addr=0, end_addr=arch.mem_size):
     print("-----------------")
 
 def dump_modified_registers_summary(es):
-    # Use a dictionary to store the last modified value for each register
-    modified_regs = {}
-    for reg_num, value in es.copyable["regStored"]:
-        modified_regs[reg_num] = value
+    # The last value stored into each register is kept as they're written
+    modified_regs = es.copyable["regStoredLast"]
 
     if not modified_regs:
         print("\n--- No Registers Modified ---")
@@ -1316,17 +1432,14 @@ def dump_modified_registers_summary(es):
     # Sort by register number for consistent output
     sorted_reg_nums = sorted(modified_regs.keys())
 
-    for reg_num in sorted_reg_nums:
-        reg = es.register[reg_num]
-        reg_name = reg.reg_name
-        reg_value = modified_regs[reg_num]
-        print(f"{reg_name}: {arith.word_to_hex4(reg_value)} ({reg_value})")
+    print("\n".join(show_reg_value(es.register[reg_num].dump_prefix, modified_regs[reg_num])
+                    for reg_num in sorted_reg_nums))
     print("--------------------------------")
 
 def dump_accessed_memory_summary(es):
     # Extract only addresses from the logs
-    all_accessed_tuples = es.copyable["memFetchInstrLog"] + es.copyable["memFetchDataLog"] + es.copyable["memStoreLog"]
-    accessed_addresses = sorted(list(set([addr for addr, _ in all_accessed_tuples])))
+    logs = (es.copyable["memFetchInstrLog"], es.copyable["memFetchDataLog"], es.copyable["memStoreLog"])
+    accessed_addresses = sorted({addr for log in logs for addr, _ in log})
 
     if not accessed_addresses:
         print("\n--- No Memory Accessed ---")
@@ -1334,19 +1447,10 @@ def dump_accessed_memory_summary(es):
 
     print("\n--- Accessed Memory Summary ---")
 
-    # Group contiguous addresses
-    grouped_addresses = []
-    if accessed_addresses:
-        current_group = [accessed_addresses[0]]
-        for i in range(1, len(accessed_addresses)):
-            if accessed_addresses[i] == current_group[-1] + 1:
-                current_group.append(accessed_addresses[i])
-            else:
-                grouped_addresses.append(current_group)
-                current_group = [accessed_addresses[i]]
-        grouped_addresses.append(current_group) # Add the last group
-
-    for group in grouped_addresses:
+    # Group contiguous addresses: within a run of consecutive addresses,
+    # address minus position in the sorted list is constant
+    for _, run in itertools.groupby(enumerate(accessed_addresses), lambda t: t[1] - t[0]):
+        group = [addr for _, addr in run]
         start_addr = group[0]
         end_addr = group[-1]
         
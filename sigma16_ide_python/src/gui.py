@@ -1,13 +1,18 @@
+import functools
+import os
+import re
 import sys
 import time
 import threading
-from PySide6.QtCore import Qt, QObject, Signal, QThread, QMutex, QWaitCondition
-from PySide6.QtGui import QFont, QAction, QIcon, QColor, QTextCharFormat, QTextCursor, QTextOption
+from PySide6.QtCore import (
+    Qt, QObject, Signal, Slot, QThread, QTimer, QMetaObject, QAbstractTableModel, QModelIndex,
+    QFile, QIODevice
+)
+from PySide6.QtGui import QFont, QAction, QIcon, QColor, QBrush, QTextCharFormat, QTextCursor, QTextFormat, QTextOption
 from PySide6.QtWidgets import (
-    QApplication, QMainWindow, QTextEdit, QPushButton, QVBoxLayout, QHBoxLayout, QWidget,
+    QApplication, QMainWindow, QTextEdit, QPlainTextEdit, QPushButton, QVBoxLayout, QHBoxLayout, QWidget,
     QTableView, QHeaderView, QSplitter, QGroupBox, QDockWidget, QFileDialog, QToolBar
 )
-from PySide6.QtGui import QStandardItemModel, QStandardItem
 
 import common
 import assembler
@@ -17,143 +22,294 @@ import state
 import architecture as arch
 from machine_view import MachineView
 
-class RegisterModel(QStandardItemModel):
+DEBUG_WORKER = False # Trace the emulator worker's runs on stdout
+
+# Display strings for every 16-bit word and for each memory row address,
+# so the models never format numbers while painting
+HEX4 = tuple(f"0x{v:04X}" for v in range(65536))
+ADDR_STR = tuple(HEX4[row * 16] for row in range(256))
+REG_NAMES = tuple(f"R{i}" for i in range(16))
+REG_HEADERS = ("Register", "Value")
+MEM_HEADERS = ("Address",) + tuple(f"+{i:X}" for i in range(16))
+HIGHLIGHT_BRUSH = QBrush(Qt.GlobalColor.yellow) # Background of recently changed registers
+
+class RegisterModel(QAbstractTableModel):
+    highlight_ticks = 3 # Updates for which a changed register stays highlighted
+
     def __init__(self, emulator_state):
-        super().__init__(16, 2)
+        super().__init__()
         self.es = emulator_state
-        self.setHorizontalHeaderLabels(["Register", "Value"])
-        self.previous_values = {} # To store previous register values for highlighting
+        self.values = [0] * 16
+        # Changed registers stay highlighted for a few updates, then fade;
+        # bit i of highlighted says whether register i is currently lit
+        self.tick = 0
+        self.changed_tick = [-self.highlight_ticks] * 16
+        self.highlighted = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 16
+
+    def columnCount(self, parent=QModelIndex()):
+        return 2
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return REG_HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        row = index.row()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if index.column() == 0:
+                return REG_NAMES[row]
+            return HEX4[self.values[row]]
+        if role == Qt.ItemDataRole.BackgroundRole and index.column() == 1 \
+                and (self.highlighted >> row) & 1:
+            return HIGHLIGHT_BRUSH # Highlight recently changed registers
+        return None
 
     def update(self):
-        for i in range(16):
-            reg_name = f"R{i}"
-            # Ensure we read the value in a thread-safe way if needed, though direct access is often fine for reads
-            value = self.es.regfile[i].get()
-            current_item = QStandardItem(reg_name)
-            value_item = QStandardItem(f"0x{value:04X}")
-
-            # Check if value has changed for highlighting
-            if reg_name in self.previous_values and self.previous_values[reg_name] != value:
-                value_item.setBackground(Qt.GlobalColor.yellow) # Highlight changed registers
-            
-            self.setItem(i, 0, current_item)
-            self.setItem(i, 1, value_item)
-            self.previous_values[reg_name] = value # Update previous value
-
-class MemoryModel(QStandardItemModel):
+        # Only rows whose value changed or whose highlight just expired are
+        # repainted
+        self.tick += 1
+        tick = self.tick
+        expired = tick - self.highlight_ticks
+        # The cached values are updated in place, cell by cell
+        values = self.values
+        changed_tick = self.changed_tick
+        changed = []
+        faded = []
+        highlighted = self.highlighted
+        for i, reg in enumerate(self.es.regfile):
+            x = reg.get()
+            if x != values[i]:
+                values[i] = x
+                changed_tick[i] = tick
+                highlighted |= 1 << i
+                changed.append(i)
+            elif changed_tick[i] == expired:
+                highlighted &= ~(1 << i)
+                faded.append(i)
+        self.highlighted = highlighted
+        # Rows whose highlight merely faded only need their background redrawn
+        self._emit_runs(changed, [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.BackgroundRole])
+        self._emit_runs(faded, [Qt.ItemDataRole.BackgroundRole])
+
+    def _emit_runs(self, rows, roles):
+        # One dataChanged per contiguous run of the sorted rows
+        start = None
+        for k, row in enumerate(rows):
+            if start is None:
+                start = row
+            if k + 1 == len(rows) or rows[k + 1] != row + 1:
+                self.dataChanged.emit(self.index(start, 1), self.index(row, 1), roles)
+                start = None
+
+class MemoryModel(QAbstractTableModel):
+    fetch_rows = 32 # Rows added per fetchMore
+
     def __init__(self, emulator_state):
-        super().__init__(256, 17)
+        super().__init__()
         self.es = emulator_state
-        header_labels = ["Address"] + [f"+{i:X}" for i in range(16)]
-        self.setHorizontalHeaderLabels(header_labels)
+        # Cells index the emulator's state vector directly rather than
+        # going through arrbuf.read_mem16 for every painted cell
+        self.mem_base = emulator_state.ab.MEM_OFFSET16
+        self.shown = [0] * 4096 # Memory contents as last repainted
+        self.loaded_rows = 0 # Rows the view has fetched so far
+        self.extent_rows = 256 # Rows the current program occupies or has written to
 
-    def update(self):
-        for row in range(256):
-            address = row * 16
-            address_item = QStandardItem(f"0x{address:04X}")
-            self.setItem(row, 0, address_item)
-            for col in range(16):
-                value = self.es.ab.read_mem16(self.es, address + col)
-                self.setItem(row, col + 1, QStandardItem(f"0x{value:04X}"))
+    def rowCount(self, parent=QModelIndex()):
+        return self.loaded_rows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 17
+
+    # Rows are handed to the view a batch at a time as it scrolls, rather
+    # than all of them up front, and only as far as the program's extent
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded_rows < self.extent_rows
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        n = min(self.fetch_rows, self.extent_rows - self.loaded_rows)
+        self.beginInsertRows(QModelIndex(), self.loaded_rows, self.loaded_rows + n - 1)
+        self.loaded_rows += n
+        self.endInsertRows()
+
+    def set_extent(self, n_words):
+        # Show just the rows holding the first n_words of memory; writes
+        # beyond them extend the view as they happen
+        self.beginResetModel()
+        self.extent_rows = max(1, min(256, (n_words + 15) // 16))
+        self.loaded_rows = 0
+        self.endResetModel()
+
+    def _grow_to(self, row):
+        if row < self.extent_rows:
+            return
+        self.extent_rows = row + 1
+        if self.loaded_rows <= row:
+            self.beginInsertRows(QModelIndex(), self.loaded_rows, row)
+            self.loaded_rows = row + 1
+            self.endInsertRows()
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return MEM_HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        # Cells are read from memory on demand, so Qt only pays for the
+        # rows that are actually in the viewport
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        row, col = index.row(), index.column()
+        if col == 0:
+            return ADDR_STR[row]
+        return HEX4[self.es.vec16[self.mem_base + row * 16 + col - 1] & 0xFFFF]
+
+    def update(self, top=0, bottom=255):
+        # Compare memory with what was last shown and repaint only the cells
+        # in rows top..bottom that differ; rows outside that range are read
+        # afresh by data() when they scroll into view
+        base = self.mem_base
+        cur = self.es.vec16[base : base + 4096]
+        shown = self.shown
+        k = self.extent_rows * 16
+        if cur[k:] != shown[k:]:
+            self._grow_to(max(a for a in range(k, 4096) if cur[a] != shown[a]) // 16)
+        bottom = min(bottom, self.loaded_rows - 1)
+        changed = []
+        # List comparisons run in C, so whole rows are compared first and
+        # only rows that differ are scanned cell by cell
+        if cur != shown:
+            for k in range(top * 16, (bottom + 1) * 16, 16):
+                if cur[k : k + 16] != shown[k : k + 16]:
+                    changed.extend(a for a in range(k, k + 16) if cur[a] != shown[a])
+        self.shown = cur
+        self._emit_runs(changed)
+
+    def apply_dirty(self, addrs):
+        # Repaint just the written cells
+        vec16 = self.es.vec16
+        base = self.mem_base
+        shown = self.shown
+        dirty = sorted(a for a in addrs if a < 4096)
+        for a in dirty:
+            shown[a] = vec16[base + a]
+        if dirty:
+            self._grow_to(dirty[-1] // 16)
+        limit = self.loaded_rows * 16
+        self._emit_runs([a for a in dirty if a < limit])
+
+    def _emit_runs(self, addrs):
+        # One dataChanged per contiguous run of the sorted addresses within a row
+        roles = [Qt.ItemDataRole.DisplayRole]
+        start = None
+        for k, a in enumerate(addrs):
+            if start is None:
+                start = a
+            if k + 1 == len(addrs) or addrs[k + 1] != a + 1 or (a + 1) % 16 == 0:
+                row = a // 16
+                self.dataChanged.emit(self.index(row, start % 16 + 1), self.index(row, a % 16 + 1), roles)
+                start = None
 
 class EmulatorWorker(QObject):
-    instruction_executed = Signal()
+    batch_size = 256 # Instructions in the first batch of a run
+    batch_time = 0.033 # Seconds each batch should take, about one paint frame
+
+    instruction_executed = Signal(object) # Carries the memory addresses written since the last emit
     execution_finished = Signal(str)
     execution_paused = Signal() # Emitted when execution pauses (e.g., after a step)
 
+    # The worker lives on one thread for the life of the window; the GUI
+    # posts run_continuous/step_once to it with a queued invokeMethod, and
+    # stop() just sets a flag the running loop checks between batches
+
     def __init__(self, emulator_state):
         super().__init__()
         self.es = emulator_state
-        self._run_continuous = False
-        self._step_once = False
-        self._stop_requested = False
-        self._mutex = QMutex()
-        self._wait_condition = QWaitCondition()
-
-    def run(self):
-        self._stop_requested = False
-        while not self._stop_requested:
-            self._mutex.lock()
-            try:
-                print(f"EmulatorWorker.run: Loop start. _run_continuous={self._run_continuous}, _step_once={self._step_once}, _stop_requested={self._stop_requested}")
-                # Determine action based on flags
-                if self._run_continuous:
-                    action = "continuous"
-                elif self._step_once:
-                    action = "step"
-                else:
-                    action = "wait"
-
-                print(f"EmulatorWorker.run: Determined action={action}")
-
-                if action == "wait":
-                    print("EmulatorWorker.run: Entering wait state...")
-                    self._wait_condition.wait(self._mutex) # Wait until signaled
-                    print("EmulatorWorker.run: Woke up from wait.")
-                    # After waking up, re-evaluate action
-                    if self._stop_requested: # Check if stop was requested while waiting
-                        print("EmulatorWorker.run: Stop requested while waiting. Breaking loop.")
-                        break
-                    if self._run_continuous:
-                        action = "continuous"
-                    elif self._step_once:
-                        action = "step"
-                    else: # Spurious wakeup or no action requested
-                        print("EmulatorWorker.run: Spurious wakeup or no action. Continuing to wait.")
-                        continue # Go back to waiting
-
-                status = self.es.ab.read_scb(self.es, self.es.ab.SCB_STATUS)
-                print(f"EmulatorWorker.run: After action determination. Status={status}")
-                if status in [self.es.ab.SCB_HALTED, self.es.ab.SCB_BREAK]:
-                    print(f"EmulatorWorker.run: Execution finished. Status={status}. Setting _stop_requested=True.")
-                    self.execution_finished.emit("Execution halted." if status == self.es.ab.SCB_HALTED else "Breakpoint reached.")
-                    self._stop_requested = True
-                    break
-
-                if action == "continuous":
-                    emulator.execute_instruction(self.es)
-                    if self._stop_requested: break # Check stop request immediately after execution
-                    self.instruction_executed.emit()
-                    time.sleep(0.05)
-                    if self._stop_requested: break # Check stop request immediately after sleep
-                elif action == "step":
-                    emulator.execute_instruction(self.es)
-                    if self._stop_requested: break # Check stop request immediately after execution
-                    self.instruction_executed.emit()
-                    self._step_once = False # Reset flag after one step
-                    self._run_continuous = False # Ensure continuous is off after a step
-                    self.execution_paused.emit()
-            finally:
-                self._mutex.unlock()
-                print("EmulatorWorker.run: Mutex unlocked.")
-
-    def start_continuous(self):
-        self._mutex.lock()
-        try:
-            self._run_continuous = True
-            self._step_once = False
-            self._wait_condition.wakeAll() # Wake up the worker
-        finally:
-            self._mutex.unlock()
-
-    def start_step(self):
-        self._mutex.lock()
-        try:
-            self._step_once = True
-            self._run_continuous = False
-            self._wait_condition.wakeAll() # Wake up the worker
-        finally:
-            self._mutex.unlock()
+        self._stop = threading.Event() # Set from the GUI thread to end a run
+        ab = emulator_state.ab
+        self._finished_messages = {ab.SCB_HALTED: "Execution halted.", ab.SCB_BREAK: "Breakpoint reached."}
+        self._read_status = functools.partial(ab.read_scb, emulator_state, ab.SCB_STATUS)
+
+    def _finished_message(self):
+        # The message for a halted or stopped-at-break processor, else None
+        return self._finished_messages.get(self._read_status())
+
+    def _mark_running(self):
+        # Leave the READY state, so that step_code can tell a program that
+        # has started stepping from one that still needs to be booted
+        self.es.ab.write_scb(self.es, self.es.ab.SCB_STATUS, self.es.ab.SCB_RUNNING_GUI)
+
+    @Slot()
+    def run_continuous(self):
+        if DEBUG_WORKER: print("EmulatorWorker.run_continuous: start")
+        self._stop.clear()
+        self._mark_running()
+        # Everything the loop touches per batch is bound to locals up front
+        es = self.es
+        read_status = self._read_status
+        finished_messages = self._finished_messages
+        execute_batch = emulator.execute_batch
+        batch_size = self.batch_size
+        batch_time = self.batch_time
+        perf_counter = time.perf_counter
+        emit_executed = self.instruction_executed.emit
+        stop_requested = self._stop.is_set
+        while not stop_requested():
+            # Run a batch of instructions per signal, so the thread
+            # spends its time emulating rather than crossing to the GUI;
+            # batches run back to back, and the GUI's paint timer decides
+            # how often the views actually refresh. The batch size adapts
+            # so a batch takes about one frame whatever the program does
+            t0 = perf_counter()
+            execute_batch(es, batch_size)
+            elapsed = perf_counter() - t0
+            if elapsed < batch_time / 2:
+                batch_size *= 2
+            elif elapsed > batch_time * 2 and batch_size > 1:
+                batch_size //= 2
+            dirty = es.dirty_addrs
+            es.dirty_addrs = set()
+            emit_executed(dirty)
+            message = finished_messages.get(read_status())
+            if message:
+                if DEBUG_WORKER: print(f"EmulatorWorker.run_continuous: {message}")
+                self.execution_finished.emit(message)
+                return
+        if DEBUG_WORKER: print("EmulatorWorker.run_continuous: stop requested")
+        self.execution_paused.emit()
+
+    @Slot()
+    def step_once(self):
+        message = self._finished_message()
+        if message:
+            self.execution_finished.emit(message)
+            return
+        self._mark_running()
+        emulator.execute_instruction(self.es)
+        self.instruction_executed.emit(self._take_dirty_addrs())
+        self.execution_paused.emit()
+
+    @Slot()
+    def reset(self):
+        # Reset the processor on the worker's own thread; a blocking queued
+        # call to this returns once any earlier run or step has finished
+        self._stop.clear()
+        emulator.proc_reset(self.es)
+        self.es.dirty_addrs = set()
+
+    def _take_dirty_addrs(self):
+        dirty = self.es.dirty_addrs
+        self.es.dirty_addrs = set()
+        return dirty
 
     def stop(self):
-        self._mutex.lock()
-        try:
-            self._stop_requested = True
-            self._run_continuous = False
-            self._step_once = False
-            self._wait_condition.wakeAll() # Wake up to allow it to exit
-        finally:
-            self._mutex.unlock()
+        self._stop.set()
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -163,6 +319,9 @@ class MainWindow(QMainWindow):
         self.showFullScreen() # Start in fullscreen by default
 
         self.es = emulator.EmulatorState(common.ES_gui_thread, arrbuf)
+        # The GUI doesn't display the register/memory access logs, so
+        # runs take the untraced path
+        self.es.trace_enabled = False
         self.setDockNestingEnabled(True)
 
         # Create main horizontal splitter
@@ -183,8 +342,10 @@ class MainWindow(QMainWindow):
         # I/O Log (bottom-left pane)
         io_group = QGroupBox("I/O Log")
         io_layout = QVBoxLayout(io_group)
-        self.io_log = QTextEdit()
+        self.io_log = QPlainTextEdit()
         self.io_log.setReadOnly(True)
+        self.io_log.setMaximumBlockCount(5000) # Bound the log's memory
+        self._io_buf = [] # Lines waiting for the next paint tick
         io_layout.addWidget(self.io_log)
         left_vertical_splitter.addWidget(io_group)
 
@@ -206,6 +367,7 @@ class MainWindow(QMainWindow):
         self.reg_model = RegisterModel(self.es)
         self.reg_view.setModel(self.reg_model)
         self.reg_view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self._fix_row_heights(self.reg_view)
         reg_layout.addWidget(self.reg_view)
         
         reg_mem_splitter.addWidget(reg_group)
@@ -217,7 +379,13 @@ class MainWindow(QMainWindow):
         self.mem_view = QTableView()
         self.mem_model = MemoryModel(self.es)
         self.mem_view.setModel(self.mem_model)
-        self.mem_view.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        # Column widths are computed once rather than with ResizeToContents,
+        # which re-measures every column whenever the data changes; they
+        # stay Interactive so the user can still drag them wider
+        mem_header = self.mem_view.horizontalHeader()
+        mem_header.setSectionResizeMode(QHeaderView.Interactive)
+        mem_header.setDefaultSectionSize(self.mem_view.fontMetrics().horizontalAdvance("0x0000") + 16)
+        self._fix_row_heights(self.mem_view)
         mem_layout.addWidget(self.mem_view)
         
         reg_mem_splitter.addWidget(mem_group)
@@ -293,40 +461,128 @@ class MainWindow(QMainWindow):
         self.toolbar.addAction(save_action)
 
         self.last_asm_info = None # To store asm_info for highlighting
+        self._pc_to_line = {} # Instruction address -> source line, for highlighting
+        self._highlighted_line = None
+        self._hl_format = QTextCharFormat() # Built once, shared by every highlight
+        self._hl_format.setBackground(QColor(Qt.GlobalColor.darkYellow))
+        self._hl_format.setProperty(QTextFormat.Property.FullWidthSelection, True)
         self.current_file = None # To keep track of the currently open file
+        self._asm_cache = (None, None) # (source text, asm_info) of the last assembly
+
+        # Repaints are coalesced: the worker only marks the views dirty and
+        # a single-shot timer refreshes them at most 30 times a second,
+        # however fast the emulator runs; when idle the timer isn't armed
+        self._dirty = False
+        self._pending_dirty_addrs = set()
+        self._mem_stale = False # Memory view skipped updates while hidden
+        self._paint_timer = QTimer(self)
+        self._paint_timer.setSingleShot(True)
+        self._paint_timer.setInterval(33)
+        self._paint_timer.timeout.connect(self._maybe_repaint)
         
         # Initialize and start the emulator thread once
         self.emulator_thread = QThread()
         self.emulator_worker = EmulatorWorker(self.es)
         self.emulator_worker.moveToThread(self.emulator_thread)
-        self.emulator_thread.started.connect(self.emulator_worker.run)
-        self.emulator_worker.instruction_executed.connect(self.update_views)
-        self.emulator_worker.execution_finished.connect(self.on_execution_finished)
-        self.emulator_worker.execution_paused.connect(self.on_execution_paused)
-        self.emulator_thread.start() # Start the worker thread once
+        self.emulator_worker.instruction_executed.connect(self._mark_dirty, Qt.ConnectionType.QueuedConnection)
+        self.emulator_worker.execution_finished.connect(self.on_execution_finished, Qt.ConnectionType.QueuedConnection)
+        self.emulator_worker.execution_paused.connect(self.on_execution_paused, Qt.ConnectionType.QueuedConnection)
+        self.emulator_thread.start() # Start the worker thread once; it runs an event loop
 
         self._assemble_and_boot() # Initialize emulator state and load code
         self.update_views()
 
-    def update_views(self):
+    def _schedule_repaint(self):
+        if not self._paint_timer.isActive():
+            self._paint_timer.start()
+
+    def _mark_dirty(self, dirty_addrs):
+        self._pending_dirty_addrs |= dirty_addrs
+        self._dirty = True
+        self._schedule_repaint()
+
+    def _log(self, message):
+        self._io_buf.append(message)
+        self._schedule_repaint()
+
+    def _flush_io(self):
+        # One append per tick rather than a relayout per message
+        if self._io_buf:
+            self.io_log.appendPlainText("\n".join(self._io_buf))
+            self._io_buf.clear()
+
+    def _clear_io_log(self):
+        self._io_buf.clear()
+        self.io_log.clear()
+
+    def _maybe_repaint(self):
+        self._flush_io()
+        if self._dirty:
+            dirty_addrs = self._pending_dirty_addrs
+            self._dirty = False
+            self._pending_dirty_addrs = set()
+            self.update_views(dirty_addrs)
+
+    def update_views(self, dirty_addrs=None):
         self.reg_model.update()
-        self.mem_model.update()
+        if dirty_addrs is None:
+            # No record of what changed (boot, reset, finish), so refresh all
+            self.es.dirty_addrs = set()
+            self.mem_model.update(*self.visible_row_range())
+            self._mem_stale = False
+        elif not self._on_screen(self.mem_view):
+            # Hidden or collapsed: catch up with a full refresh once it's back
+            self._mem_stale = True
+        elif self._mem_stale:
+            self.mem_model.update(*self.visible_row_range())
+            self._mem_stale = False
+        else:
+            self.mem_model.apply_dirty(dirty_addrs)
         self._highlight_current_instruction()
-        self.machine_view.update_view() # Update the new machine view
+        if self._on_screen(self.machine_view):
+            self.machine_view.update_view() # Update the new machine view
+
+    def _on_screen(self, widget):
+        return widget.isVisible() and not widget.visibleRegion().isEmpty()
+
+    def _fix_row_heights(self, view):
+        # Uniform rows let the view lay out without measuring each one
+        v = view.verticalHeader()
+        v.setSectionResizeMode(QHeaderView.Fixed)
+        v.setDefaultSectionSize(v.fontMetrics().height() + 4)
+        view.setShowGrid(False)
+
+    def visible_row_range(self):
+        # Rows of the memory view currently on screen; rows scrolled into
+        # view later are read afresh by the lazy model anyway
+        top = self.mem_view.rowAt(0)
+        bottom = self.mem_view.rowAt(self.mem_view.viewport().height() - 1)
+        if top < 0:
+            return 0, 255
+        return top, 255 if bottom < 0 else bottom
+
+    def _assemble(self, source_code):
+        # Reuse the last assembly while the editor text is unchanged
+        if self._asm_cache[0] == source_code:
+            return self._asm_cache[1]
+        asm_info = assembler.assembler("my_module", source_code)
+        self._asm_cache = (source_code, asm_info)
+        return asm_info
 
     def _assemble_and_boot(self):
-        self.io_log.clear()
+        self._clear_io_log()
         source_code = self.code_editor.toPlainText()
-        asm_info = assembler.assembler("my_module", source_code)
+        asm_info = self._assemble(source_code)
 
         if asm_info.n_asm_errors > 0:
-            self.io_log.setText(asm_info.md_text)
-            self.last_asm_info = None # Clear previous asm_info on error
+            self._log(asm_info.md_text)
+            self._set_asm_info(None) # Clear previous asm_info on error
             return False
 
         obj_md = state.ObjMd(asm_info.asm_mod_name, asm_info.object_text, asm_info.md_text)
         emulator.boot(self.es, obj_md)
-        self.last_asm_info = asm_info # Store for highlighting
+        self.mem_model.set_extent(max((stmt["address"].word + stmt["codeSize"].word for stmt in asm_info.asm_stmt), default=0))
+        self._set_asm_info(asm_info) # Store for highlighting
         self.update_views() # Show initial state after boot
         return True
 
@@ -339,7 +595,7 @@ class MainWindow(QMainWindow):
         self.pause_action.setEnabled(True)
         self.step_action.setEnabled(False)
 
-        self.emulator_worker.start_continuous() # Tell worker to run continuously
+        QMetaObject.invokeMethod(self.emulator_worker, "run_continuous", Qt.ConnectionType.QueuedConnection)
 
     def pause_execution(self):
         if self.emulator_worker: 
@@ -349,7 +605,9 @@ class MainWindow(QMainWindow):
 
     def step_code(self):
         # Only assemble and boot if the emulator is halted or ready (initial state)
-        if self.es.ab.read_scb(self.es, self.es.ab.SCB_STATUS) in [self.es.ab.SCB_HALTED, self.es.ab.SCB_READY]:
+        ab = self.es.ab
+        status = ab.read_scb(self.es, ab.SCB_STATUS)
+        if status in (ab.SCB_HALTED, ab.SCB_READY):
             if not self._assemble_and_boot():
                 return
 
@@ -357,10 +615,10 @@ class MainWindow(QMainWindow):
         self.pause_action.setEnabled(False)
         self.step_action.setEnabled(False)
 
-        self.emulator_worker.start_step() # Tell worker to do one step
+        QMetaObject.invokeMethod(self.emulator_worker, "step_once", Qt.ConnectionType.QueuedConnection)
 
     def on_execution_finished(self, message):
-        self.io_log.append(message)
+        self._log(message)
         self.update_views() # Final update
         self.run_action.setEnabled(True)
         self.pause_action.setEnabled(False)
@@ -369,39 +627,24 @@ class MainWindow(QMainWindow):
         # No need to quit/wait the thread here, it should remain alive
 
     def on_execution_paused(self):
-        self.io_log.append("Execution paused.")
+        self._log("Execution paused.")
         self.update_views() # Update views after pause
         self.run_action.setEnabled(True)
         self.pause_action.setEnabled(False)
         self.step_action.setEnabled(True) 
 
     def reset_emulator(self):
-        # Stop the worker if it's running continuously
-        if self.emulator_worker: # Check if worker exists
-            self.emulator_worker.stop() # Request worker to stop its loop
-            time.sleep(0.1) # Give a moment for the worker to process the stop request
-            self.emulator_thread.quit() # Tell the thread to quit
-            self.emulator_thread.wait() # Wait for the thread to finish
-            self.emulator_thread = None # Clear reference to old thread
-            self.emulator_worker = None # Clear reference to old worker
-
-        # Re-initialize emulator state (registers, memory, etc.)
-        emulator.proc_reset(self.es) 
-        
-        # Re-create the worker and thread for a fresh start
-        self.emulator_thread = QThread()
-        self.emulator_worker = EmulatorWorker(self.es)
-        self.emulator_worker.moveToThread(self.emulator_thread)
-        self.emulator_thread.started.connect(self.emulator_worker.run)
-        self.emulator_worker.instruction_executed.connect(self.update_views)
-        self.emulator_worker.execution_finished.connect(self.on_execution_finished)
-        self.emulator_worker.execution_paused.connect(self.on_execution_paused)
-        self.emulator_thread.start() # Start the new worker thread
+        # Stop the worker if it's running continuously, then have it
+        # re-initialize the emulator state (registers, memory, etc.); the
+        # blocking call returns as soon as the worker has finished its
+        # current batch, so there is nothing to sleep for
+        self.emulator_worker.stop() # Request worker to stop its loop
+        QMetaObject.invokeMethod(self.emulator_worker, "reset", Qt.ConnectionType.BlockingQueuedConnection)
 
         self._assemble_and_boot() # Re-assemble and boot the code after reset
-        self.io_log.clear() # Clear the I/O log
-        self.io_log.append("Emulator reset.")
-        self.last_asm_info = None # Clear asm_info on reset
+        self._clear_io_log() # Clear the I/O log
+        self._log("Emulator reset.")
+        self._set_asm_info(None) # Clear asm_info on reset
         self._clear_highlight() # Clear any line highlighting
         self.update_views() # Update the register and memory views
 
@@ -410,52 +653,44 @@ class MainWindow(QMainWindow):
         self.pause_action.setEnabled(False)
         self.step_action.setEnabled(True)
 
+    def _set_asm_info(self, asm_info):
+        # Map each instruction's address to its source line once per
+        # assembly, so highlighting the current instruction is a lookup.
+        # Directives don't generate code and are skipped; where several
+        # statements share an address the first one wins. Booting the same
+        # (cached) assembly again keeps the existing map
+        if asm_info is not None and asm_info is self.last_asm_info:
+            return
+        self.last_asm_info = asm_info
+        self._pc_to_line = {}
+        if asm_info:
+            for stmt in asm_info.asm_stmt:
+                if stmt["operation"]["ifmt"] != arch.iDir:
+                    self._pc_to_line.setdefault(stmt["address"].word, stmt["lineNumber"])
+
     def _highlight_current_instruction(self):
+        target_line_number = self._pc_to_line.get(getattr(self.es, 'cur_instr_addr', None))
+        if target_line_number == self._highlighted_line:
+            return # Already highlighted
         self._clear_highlight() # Clear any existing highlight
+        self._highlighted_line = target_line_number
 
-        # Ensure es.cur_instr_addr is set and valid
-        if hasattr(self.es, 'cur_instr_addr') and self.es.cur_instr_addr is not None:
-            if self.last_asm_info:
-                # Get the line number from the assembler's metadata
-                # The metadata maps the address of the *generated code* to the *source line number*.
-                # For directives like 'start:', the address is 0, but the actual instruction is on the next line.
-                # We need to ensure we highlight the line of the *executable* instruction.
-                
-                # Iterate through asm_stmt to find the correct line to highlight
-                target_line_number = None
-                for stmt in self.last_asm_info.asm_stmt:
-                    # Check if the statement's address matches the current instruction address
-                    # AND if it's an actual instruction (not a directive that doesn't generate code)
-                    if stmt["address"].word == self.es.cur_instr_addr and stmt["operation"]["ifmt"] != arch.iDir:
-                        target_line_number = stmt["lineNumber"]
-                        break
-                
-                if target_line_number is not None:
-                    format = QTextCharFormat()
-                    format.setBackground(QColor(Qt.GlobalColor.darkYellow))
-
-                    cursor = self.code_editor.textCursor()
-                    cursor.setPosition(0) # Start from the beginning
-                    # Move to the start of the target line
-                    cursor.movePosition(QTextCursor.MoveOperation.Down, QTextCursor.MoveMode.MoveAnchor, target_line_number)
-                    cursor.movePosition(QTextCursor.MoveOperation.StartOfLine, QTextCursor.MoveMode.MoveAnchor)
-                    cursor.movePosition(QTextCursor.MoveOperation.EndOfLine, QTextCursor.MoveMode.KeepAnchor)
-                    
-                    self.code_editor.setTextCursor(cursor)
-                    self.code_editor.setCurrentCharFormat(format)
-                    # Ensure the highlighted line is visible
-                    self.code_editor.ensureCursorVisible()
-            
-    def _clear_highlight(self):
-        format = QTextCharFormat()
-        format.setBackground(QColor(Qt.GlobalColor.transparent)) # Or default background color
+        if target_line_number is not None:
+            # The line is marked with an extra selection, which Qt draws as
+            # an overlay without touching the document's own formats
+            block = self.code_editor.document().findBlockByNumber(target_line_number)
+            selection = QTextEdit.ExtraSelection()
+            selection.format = self._hl_format
+            selection.cursor = QTextCursor(block)
+            self.code_editor.setExtraSelections([selection])
 
-        cursor = self.code_editor.textCursor()
-        cursor.select(QTextCursor.SelectionType.Document) # Select entire document
-        self.code_editor.setTextCursor(cursor)
-        self.code_editor.setCurrentCharFormat(format)
-        cursor.clearSelection() # Clear selection after applying format
-        self.code_editor.setTextCursor(cursor) # Restore cursor position
+            # Ensure the highlighted line is visible
+            self.code_editor.setTextCursor(QTextCursor(block))
+            self.code_editor.ensureCursorVisible()
+
+    def _clear_highlight(self):
+        self._highlighted_line = None
+        self.code_editor.setExtraSelections([])
 
     def open_file(self):
         file_name, _ = QFileDialog.getOpenFileName(self, "Open Assembly File", ".", "Assembly Files (*.asm.txt);;All Files (*)")
@@ -465,19 +700,19 @@ class MainWindow(QMainWindow):
                     self.code_editor.setText(f.read())
                 self.current_file = file_name
                 self.setWindowTitle(f"Sigma16 IDE - {file_name}")
-                self.io_log.append(f"File loaded: {self.current_file}")
+                self._log(f"File loaded: {self.current_file}")
                 self.reset_emulator() # Reset emulator state after loading new file
             except Exception as e:
-                self.io_log.append(f"Error opening file: {e}")
+                self._log(f"Error opening file: {e}")
 
     def save_file(self):
         if self.current_file:
             try:
                 with open(self.current_file, 'w') as f:
                     f.write(self.code_editor.toPlainText())
-                self.io_log.append(f"File saved: {self.current_file}")
+                self._log(f"File saved: {self.current_file}")
             except Exception as e:
-                self.io_log.append(f"Error saving file: {e}")
+                self._log(f"Error saving file: {e}")
         else:
             self.save_file_as()
 
@@ -489,9 +724,9 @@ class MainWindow(QMainWindow):
                     f.write(self.code_editor.toPlainText())
                 self.current_file = file_name
                 self.setWindowTitle(f"Sigma16 IDE - {file_name}")
-                self.io_log.append(f"File saved as: {self.current_file}")
+                self._log(f"File saved as: {self.current_file}")
             except Exception as e:
-                self.io_log.append(f"Error saving file: {e}")
+                self._log(f"Error saving file: {e}")
 
     def toggle_fullscreen(self):
         if self.isFullScreen():
@@ -499,153 +734,26 @@ class MainWindow(QMainWindow):
         else:
             self.showFullScreen()
 
+THEME_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resources", "theme.qss")
+
+def load_theme():
+    # The stylesheet lives in resources/theme.qss rather than in the code
+    f = QFile(THEME_PATH)
+    if not f.open(QIODevice.OpenModeFlag.ReadOnly | QIODevice.OpenModeFlag.Text):
+        print(f"Could not open theme {THEME_PATH}")
+        return ""
+    try:
+        text = bytes(f.readAll()).decode("utf-8")
+    finally:
+        f.close()
+    # Comments and layout whitespace are only for people editing the file
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.DOTALL)
+    return re.sub(r"\s+", " ", text).strip()
+
 def start_gui():
     app = QApplication(sys.argv)
     # Apply a modern QSS theme
-    app.setStyleSheet("""
-    QMainWindow {
-        background-color: #1a1a1a; /* Darker background */
-        color: #e0e0e0; /* Lighter text for contrast */
-    }
-    QTextEdit {
-        background-color: #2a2a2a; /* Slightly lighter than main window */
-        color: #00ff00; /* Green text for code, hi-tech feel */
-        border: 1px solid #007acc; /* Blue border for focus */
-        padding: 5px;
-        font-family: "Consolas", "Monaco", "Courier New", monospace; /* Monospaced font */
-        font-size: 10pt;
-    }
-    QPushButton {
-        background-color: #007acc; /* Vibrant blue */
-        color: #ffffff;
-        border: none;
-        padding: 8px 16px;
-        border-radius: 4px;
-        font-weight: bold;
-    }
-    QPushButton:hover {
-        background-color: #005f99; /* Darker blue on hover */
-    }
-    QPushButton:pressed {
-        background-color: #003f66; /* Even darker blue on press */
-    }
-    QTableView {
-        background-color: #2a2a2a;
-        color: #e0e0e0;
-        border: 1px solid #007acc;
-        gridline-color: #444444; /* Subtle grid lines */
-        selection-background-color: #007acc;
-        selection-color: #ffffff;
-    }
-    QHeaderView::section {
-        background-color: #3a3a3a;
-        color: #e0e0e0;
-        padding: 4px;
-        border: 1px solid #007acc;
-        font-weight: bold;
-    }
-    QGroupBox {
-        background-color: #1a1a1a;
-        color: #e0e0e0;
-        border: 1px solid #007acc;
-        border-radius: 4px;
-        margin-top: 10px;
-    }
-    QGroupBox::title {
-        subcontrol-origin: margin;
-        subcontrol-position: top left;
-        padding: 0 3px;
-        color: #00ff00; /* Green title for hi-tech */
-        font-weight: bold;
-    }
-    QDockWidget {
-        background-color: #1a1a1a;
-        color: #e0e0e0;
-        border: 1px solid #007acc;
-    }
-    QDockWidget::title {
-        background-color: #2a2a2a;
-        padding: 5px;
-        text-align: center;
-        color: #e0e0e0;
-        font-weight: bold;
-    }
-    QMenuBar {
-        background-color: #2a2a2a;
-        color: #e0e0e0;
-    }
-    QMenuBar::item {
-        padding: 5px 10px;
-        background-color: transparent;
-    }
-    QMenuBar::item:selected {
-        background-color: #007acc;
-    }
-    QMenu {
-        background-color: #2a2a2a;
-        color: #e0e0e0;
-        border: 1px solid #007acc;
-    }
-    QMenu::item {
-        padding: 5px 20px;
-    }
-    QMenu::item:selected {
-        background-color: #007acc;
-    }
-    QToolBar {
-        background-color: #2a2a2a;
-        border: none;
-        padding: 5px;
-    }
-    QToolButton {
-        background-color: transparent;
-        border: none;
-        padding: 5px;
-        color: #e0e0e0;
-    }
-    QToolButton:hover {
-        background-color: #005f99;
-        border-radius: 3px;
-    }
-    QToolButton:pressed {
-        background-color: #003f66;
-    }
-    /* Scrollbar styling for a more modern look */
-    QScrollBar:vertical {
-        border: 1px solid #444;
-        background: #333;
-        width: 10px;
-        margin: 0px 0px 0px 0px;
-    }
-    QScrollBar::handle:vertical {
-        background: #007acc;
-        min-height: 20px;
-        border-radius: 3px;
-    }
-    QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {
-        background: none;
-    }
-    QScrollBar::add-page:vertical, QScrollBar::sub-page:vertical {
-        background: none;
-    }
-    QScrollBar:horizontal {
-        border: 1px solid #444;
-        background: #333;
-        height: 10px;
-        margin: 0px 0px 0px 0px;
-    }
-    QScrollBar::handle:horizontal {
-        background: #007acc;
-        min-width: 20px;
-        border-radius: 3px;
-    }
-    QScrollBar::add-line:horizontal, QScrollBar::sub-line:horizontal {
-        background: none;
-    }
-    QScrollBar::add-page:horizontal, QScrollBar::sub-page:horizontal {
-        background: none;
-    }
-    """)
+    app.setStyleSheet(load_theme())
     window = MainWindow()
     window.show()
     sys.exit(app.exec())
\ No newline at end of file
@@ -21,34 +21,58 @@
 # relocation; and loading an object module into memory.
 # -------------------------------------------------------------------------
 
+from bisect import bisect_right
+
 import common
 import s16module as smod
 import architecture as arch
 import arithmetic as arith
 import state as st
-import assembler as asm # Import assembler for parse_obj_line
 
 # ------------------------------------------------------------------------
 # Helper functions
 # ------------------------------------------------------------------------
 
-def adjust(ls, om, addr, f):
-    found = False
-    for b in om.data_blocks:
-        if b.block_start <= addr < b.block_start + b.block_size:
-            x = b.xs[addr - b.block_start]
-            y = f(x)
-            print(f"    Adjusting block {om.data_blocks.index(b)}" \
-                  f" start={arith.word_to_hex4(b.block_start)}" \
-                  f" size={b.block_size}" \
-                  f" addr={arith.word_to_hex4(addr)}" \
-                  f" old={arith.word_to_hex4(x)}" \
-                  f" new={arith.word_to_hex4(y)}")
-            b.xs[addr - b.block_start] = y
-            found = True
-            break
-    if not found:
+def index_blocks(om):
+    # Sorted block starts and ends, so find_block can bisect instead of scanning
+    om.block_starts = [b.block_start for b in om.data_blocks]
+    om.block_ends = [b.block_start + b.block_size for b in om.data_blocks]
+
+def find_block(om, addr):
+    i = bisect_right(om.block_starts, addr) - 1
+    if i < 0 or addr >= om.block_ends[i]:
         print(f"Linker error: address {arith.word_to_hex4(addr)} not defined")
+        return -1
+    return i
+
+def adjust_set(ls, om, addr, new_val):
+    i = find_block(om, addr)
+    if i >= 0:
+        b = om.data_blocks[i]
+        x = b.xs[addr - b.block_start]
+        y = new_val & 0xFFFF
+        if common.mode.trace:
+            show_adjust(om, i, addr, x, y)
+        b.xs[addr - b.block_start] = y
+
+def adjust_add(ls, om, addr, delta):
+    i = find_block(om, addr)
+    if i >= 0:
+        b = om.data_blocks[i]
+        x = b.xs[addr - b.block_start]
+        y = (x + delta) & 0xFFFF
+        if common.mode.trace:
+            show_adjust(om, i, addr, x, y)
+        b.xs[addr - b.block_start] = y
+
+def show_adjust(om, i, addr, x, y):
+    b = om.data_blocks[i]
+    print(f"    Adjusting block {i}" \
+          f" start={om.block_hex_starts[i]}" \
+          f" size={b.block_size}" \
+          f" addr={arith.word_to_hex4(addr)}" \
+          f" old={arith.word_to_hex4(x)}" \
+          f" new={arith.word_to_hex4(y)}")
 
 # ------------------------------------------------------------------------
 # GUI interface to linker (placeholders for now)
@@ -79,7 +103,7 @@ def linker(main_name, obj_mds):
     pass2(ls)  # process imports and relocations
     ls.exe_code_text = emit_code(ls)
     ls.exe_md_text = ls.metadata.to_text()
-    ls.exe_obj_md = None if len(ls.link_errors) > 0 else st.ObjMd("executable", ls.exe_code_text, ls.exe_md_text)
+    ls.exe_obj_md = None if ls.link_errors else st.ObjMd("executable", ls.exe_code_text, ls.exe_md_text)
     print(f"Number of linker errors = {len(ls.link_errors)}")
     print(f"Linker errors = {ls.link_errors}")
     return ls
@@ -97,15 +121,16 @@ def pass1(ls):
         oi = st.ObjectInfo(ls.m_count, obj_md.mod_name, obj_md)
         ls.mod_map[oi.mod_name] = oi
         ls.oi_list.append(oi)
-        oi.object_lines = obj_md.obj_text.split("\n")
+        oi.object_lines = obj_md.obj_lines  # already split by ObjMd
         oi.metadata = st.Metadata()
         oi.metadata.from_text(oi.md_text)
         oi.start_address = ls.location_counter
-        oi.src_line_origin = len(ls.metadata.get_plain_lines())
-        ls.metadata.add_src_lines(oi.metadata.get_src_lines())
+        oi.src_line_origin = ls.metadata.n_src_lines()
+        ls.metadata.add_src_from(oi.metadata)
         parse_object(ls, oi)
+        index_blocks(oi)
         oi.metadata.translate_map(oi.start_address, oi.src_line_origin)
-        ls.metadata.add_pairs(oi.metadata.pairs)
+        ls.metadata.add_pairs(oi.metadata.pair_addrs, oi.metadata.pair_idxs)
         ls.m_count += 1
     print("Linker pass1 finished")
     ls.show_mod_map()
@@ -116,36 +141,58 @@ def parse_object(ls, obj):
     ls.mod_map[obj.mod_name] = obj
     obj.asm_export_map = {}
     rel_k = obj.start_address
+    dispatch = _OP_DISPATCH
+    parse = st.parse_obj_line
 
     for x in obj.object_lines:
-        fields = asm.parse_obj_line(x) # Use assembler's parse_obj_line
-        common.mode.devlog(f"--op={fields["operation"]} args={fields["operands"]}")
-        if not x.strip(): # Check for empty or whitespace-only lines
-            pass
-        elif fields["operation"] == "module":
-            obj.dclmodname = fields["operands"][0]
-            common.mode.devlog(f"  Module name: {obj.dclmodname}")
-        elif fields["operation"] == "data":
-            common.mode.devlog("-- data")
-            for val_str in fields["operands"]:
-                val = arith.hex4_to_word(val_str)
-                safe_val = val if not arith.is_nan(val) else 0
-                common.mode.devlog(f"  {arith.word_to_hex4(ls.location_counter)} " \
-                                 f"{arith.word_to_hex4(safe_val)}")
-                obj.data_blocks[-1].insert_word(safe_val)
-                ls.location_counter += 1
-        elif fields["operation"] == "import":
-            obj.asm_imports.append(st.AsmImport(*fields["operands"]))
-        elif fields["operation"] == "export":
-            name, val, status = fields["operands"]
-            val_num = arith.hex4_to_word(val)
-            val_exp = val_num + rel_k if status == "relocatable" else val_num
-            x = st.AsmExport(name, val_exp, status)
-            obj.asm_export_map[name] = x
-        elif fields["operation"] == "relocate":
-            obj.relocations.extend(fields["operands"])
-        else:
-            common.mode.devlog(f">>> Syntax error ({fields["operation"]})")
+        if not x or x.isspace(): # Skip empty or whitespace-only lines
+            continue
+        op, operands = parse(x)
+        if common.mode.trace:
+            common.mode.devlog(f"--op={op} args={operands}")
+        h = dispatch.get(op)
+        if h:
+            h(ls, obj, operands, rel_k)
+        elif common.mode.trace:
+            common.mode.devlog(f">>> Syntax error ({op})")
+
+def _h_module(ls, obj, operands, rel_k):
+    obj.dclmodname = operands[0]
+    if common.mode.trace:
+        common.mode.devlog(f"  Module name: {obj.dclmodname}")
+
+def _h_data(ls, obj, operands, rel_k):
+    # NaN marks a malformed word, which is loaded as 0
+    ws = [w if w == w else 0 for w in map(arith.hex4_to_word, operands)]
+    if common.mode.trace:
+        common.mode.devlog("-- data")
+        for i, w in enumerate(ws):
+            common.mode.devlog(f"  {arith.word_to_hex4(ls.location_counter + i)} " \
+                               f"{arith.word_to_hex4(w)}")
+    obj.data_blocks[-1].insert_words(ws)
+    ls.location_counter += len(ws)
+
+def _h_import(ls, obj, operands, rel_k):
+    obj.asm_imports.append(st.AsmImport(*operands))
+
+def _h_export(ls, obj, operands, rel_k):
+    name, val, status = operands
+    val_num = arith.hex4_to_word(val)
+    val_exp = val_num + rel_k if status == "relocatable" else val_num
+    x = st.AsmExport(name, val_exp, status)
+    obj.asm_export_map[name] = x
+    ls.global_exports[(obj.mod_name, name)] = x
+
+def _h_relocate(ls, obj, operands, rel_k):
+    obj.relocations.extend(map(arith.hex4_to_word, operands))
+
+_OP_DISPATCH = {
+    "module": _h_module,
+    "data": _h_data,
+    "import": _h_import,
+    "export": _h_export,
+    "relocate": _h_relocate,
+}
 
 # -------------------------------------------------------------------------
 # Linker pass 2
@@ -155,31 +202,30 @@ def pass2(ls):
     print("Linker Pass 2")
     for oi in ls.oi_list:
         print(f"--- pass 2 oi {oi.index} ({oi.mod_name})")
+        if common.mode.trace:
+            oi.block_hex_starts = [arith.word_to_hex4(x) for x in oi.block_starts]
         resolve_imports(ls, oi)
         resolve_relocations(ls, oi)
 
 def resolve_imports(ls, om):
     print(f"Resolving imports for {om.mod_name}")
+    exports = ls.global_exports
     for x in om.asm_imports:
-        if x.mod in ls.mod_map:  # does import module exist?
-            exporter = ls.mod_map[x.mod]
-            if x.name in exporter.asm_export_map:  # is name exported?
-                v = exporter.asm_export_map[x.name]
-                addr_num = arith.hex4_to_word(x.addr)
-                val_num = v.val
-                adjust(ls, om, addr_num, lambda y: val_num)
-            else:
-                print(f"Linker error: {x.name} not exported by {x.mod}")
+        v = exports.get((x.mod, x.name))
+        if v is not None:
+            adjust_set(ls, om, x.addr_num, v.val)
+        elif x.mod in ls.mod_map:  # module exists, name is not exported
+            print(f"Linker error: {x.name} not exported by {x.mod}")
         else:
             print(f"Linker error: {x.mod} not found")
 
 def resolve_relocations(ls, om):
     rel_k = om.start_address
     print(f"Resolving relocations for {om.mod_name} relocation={arith.word_to_hex4(rel_k)}")
-    for a in om.relocations:
-        print(f"  relocate {arith.word_to_hex4(arith.hex4_to_word(a))}")
-        address_num = arith.hex4_to_word(a)
-        adjust(ls, om, address_num, lambda y: y + rel_k)
+    for address_num in om.relocations:
+        if common.mode.trace:
+            print(f"  relocate {arith.word_to_hex4(address_num)}")
+        adjust_add(ls, om, address_num, rel_k)
 
 # -------------------------------------------------------------------------
 # Emit object code
@@ -188,15 +234,18 @@ def resolve_relocations(ls, om):
 def emit_code(ls):
     print("Emit object code")
     exe_code = ""
-    if len(ls.link_errors) > 0:
+    if ls.link_errors:
         print("Link errors, cannot emit code")
     else:
+        w2h = arith.word_to_hex4
+        parts = []
         for oi in ls.oi_list:
             print(f"Emitting code for {oi.mod_name}")
-            exe_code += f"module {oi.mod_name}\n"
-            exe_code += f"org {arith.word_to_hex4(oi.start_address)}\n"
+            parts.append(f"module {oi.mod_name}\n")
+            parts.append(f"org {w2h(oi.start_address)}\n")
             for b in oi.data_blocks:
-                exe_code += emit_object_words(b.xs)
+                parts.append(emit_object_words(b.xs))
+        exe_code = "".join(parts)
         print("Executable code:")
         print(exe_code)
     return exe_code
@@ -204,12 +253,9 @@ def emit_code(ls):
 obj_buffer_limit = 8
 
 def emit_object_words(ws):
-    code = ""
-    temp_ws = list(ws) # Create a mutable copy
-    while temp_ws:
-        xs = temp_ws[:obj_buffer_limit]
-        temp_ws = temp_ws[obj_buffer_limit:]
-        ys = [arith.word_to_hex4(w) for w in xs]
-        zs = 'data ' + ','.join(ys) + "\n"
-        code += zs
-    return code
+    # Hex the whole block in one call, then cut it into 4-digit words
+    # and lines of obj_buffer_limit words
+    h = arith.words_to_hex(ws)
+    n = 4 * obj_buffer_limit
+    return "".join("data " + ",".join(h[j:j+4] for j in range(i, min(i + n, len(h)), 4)) + "\n"
+                   for i in range(0, len(h), n))
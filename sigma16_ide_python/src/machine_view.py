@@ -1,129 +1,128 @@
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel
-from PySide6.QtGui import QPainter, QColor, QFont, QPen
+from PySide6.QtGui import QPainter, QColor, QFont, QPen, QPixmap
 from PySide6.QtCore import Qt, QRect
 
+import functools
+
 import arithmetic as arith
 
+@functools.lru_cache(maxsize=4096)
+def value_text(label, value):
+    # Labelled hex values are cached, as most of them are unchanged from
+    # one repaint to the next
+    return f"{label}: 0x{value:04X}"
+
+MEM_LABELS = tuple(f"0x{a:04X}" for a in range(8)) # Addresses shown in the memory block
+REG_NAMES = tuple(f"R{i}" for i in range(16))
+
+# Colors for the diagram
+BACKGROUND_COLOR = QColor("#1a1a1a")
+COMPONENT_FILL_COLOR = QColor("#2a2a2a")
+COMPONENT_BORDER_COLOR = QColor("#007acc")
+TEXT_COLOR = QColor("#e0e0e0")
+VALUE_COLOR = QColor("#00ff00") # Green for dynamic values
+BUS_COLOR = QColor("#ff8c00") # Orange for buses
+HIGHLIGHT_COLOR = QColor("#ffff00") # Yellow for highlighting
+
+REG_HEIGHT = 15 # Line height of the register list
+
 class MachineView(QWidget):
     def __init__(self, emulator_state, parent=None):
         super().__init__(parent)
         self.es = emulator_state
         self.setMinimumSize(800, 600) # Adjust size for diagram
-        self.previous_reg_values = {} # Initialize dictionary to store previous register values
-
-    def paintEvent(self, event):
-        painter = QPainter(self)
+        self.reg_values = None # Values shown at the last update_view
+        self.ctl_values = None
+        self.mem_values = None
+        self.changed_regs = set() # Registers highlighted as changed
+        self._bg_pixmap = None # Static part of the diagram, rebuilt on resize
+
+        # Fonts and pens are made once rather than on every paint
+        self._font_title = QFont("Arial", 16, QFont.Bold)
+        self._font_label = QFont("Arial", 12, QFont.Bold)
+        self._font_body = QFont("Arial", 10)
+        self._font_mono = QFont("Courier New", 9)
+        self._font_mono_sm = QFont("Courier New", 8)
+        self._pen_border = QPen(COMPONENT_BORDER_COLOR, 2)
+        self._pen_border_thin = QPen(COMPONENT_BORDER_COLOR, 1)
+        self._pen_bus = QPen(BUS_COLOR, 2, Qt.DotLine) # Dotted lines for buses
+        self._pen_highlight = QPen(HIGHLIGHT_COLOR, 1)
+
+    def resizeEvent(self, event):
+        self._bg_pixmap = None
+        super().resizeEvent(event)
+
+    def _layout(self):
+        self._cpu_rect = QRect(self.width() // 2 - 150, 50, 300, 200)
+        self._gpr_rect = QRect(50, self._cpu_rect.y(), 120, 280) # Increased height from 200 to 280
+        self._cr_rect = QRect(self._cpu_rect.x(), self._cpu_rect.bottom() + 30, self._cpu_rect.width(), 150)
+        self._mem_rect = QRect(self.width() - 150, self._cpu_rect.y(), 100, 200)
+
+    def _build_background(self):
+        # Draw the boxes, titles and buses once; paintEvent blits this and
+        # only draws the values on top
+        self._layout()
+        cpu_rect, gpr_rect = self._cpu_rect, self._gpr_rect
+        cr_rect, mem_rect = self._cr_rect, self._mem_rect
+        dpr = self.devicePixelRatioF()
+        pixmap = QPixmap(self.size() * dpr)
+        pixmap.setDevicePixelRatio(dpr)
+        painter = QPainter(pixmap)
         painter.setRenderHint(QPainter.Antialiasing)
 
-        # Define colors for the diagram
-        background_color = QColor("#1a1a1a")
-        component_fill_color = QColor("#2a2a2a")
-        component_border_color = QColor("#007acc")
-        text_color = QColor("#e0e0e0")
-        value_color = QColor("#00ff00") # Green for dynamic values
-        bus_color = QColor("#ff8c00") # Orange for buses
-        highlight_color = QColor("#ffff00") # Yellow for highlighting
-
         # Fill background
-        painter.fillRect(self.rect(), background_color)
+        painter.fillRect(self.rect(), BACKGROUND_COLOR)
 
-        painter.setPen(QPen(component_border_color, 2))
-        painter.setFont(QFont("Arial", 10))
+        painter.setPen(self._pen_border)
+        painter.setFont(self._font_body)
 
         # --- CPU Block ---
-        cpu_rect = QRect(self.width() // 2 - 150, 50, 300, 200)
-        painter.fillRect(cpu_rect, component_fill_color)
+        painter.fillRect(cpu_rect, COMPONENT_FILL_COLOR)
         painter.drawRect(cpu_rect)
-        painter.setPen(text_color)
-        painter.setFont(QFont("Arial", 16, QFont.Bold))
+        painter.setPen(TEXT_COLOR)
+        painter.setFont(self._font_title)
         painter.drawText(cpu_rect.adjusted(0, 0, 0, -cpu_rect.height() + 30), Qt.AlignCenter, "CPU")
 
         # Internal CPU components (simplified)
-        painter.setFont(QFont("Arial", 10))
-        painter.setPen(QPen(component_border_color, 1))
+        painter.setFont(self._font_body)
+        painter.setPen(self._pen_border_thin)
 
         alu_rect = QRect(cpu_rect.x() + 20, cpu_rect.y() + 50, 120, 60)
         painter.fillRect(alu_rect, QColor("#3a3a3a"))
         painter.drawRect(alu_rect)
-        painter.setPen(text_color)
+        painter.setPen(TEXT_COLOR)
         painter.drawText(alu_rect, Qt.AlignCenter, "ALU")
 
         control_unit_rect = QRect(cpu_rect.x() + 160, cpu_rect.y() + 50, 120, 60)
         painter.fillRect(control_unit_rect, QColor("#3a3a3a"))
         painter.drawRect(control_unit_rect)
-        painter.setPen(text_color)
+        painter.setPen(TEXT_COLOR)
         painter.drawText(control_unit_rect, Qt.AlignCenter, "Control Unit")
 
         # --- General Purpose Registers (R0-R15) ---
-        gpr_rect = QRect(50, cpu_rect.y(), 120, 280) # Increased height from 200 to 280
-        painter.fillRect(gpr_rect, component_fill_color)
+        painter.fillRect(gpr_rect, COMPONENT_FILL_COLOR)
         painter.drawRect(gpr_rect)
-        painter.setPen(text_color)
-        painter.setFont(QFont("Arial", 12, QFont.Bold))
+        painter.setPen(TEXT_COLOR)
+        painter.setFont(self._font_label)
         painter.drawText(gpr_rect.adjusted(0, 0, 0, -gpr_rect.height() + 20), Qt.AlignCenter, "GPRs")
 
-        painter.setFont(QFont("Courier New", 9))
-        reg_y_offset = gpr_rect.y() + 30
-        reg_height = 15
-        for i in range(16):
-            reg_name = f"R{i}"
-            value = self.es.regfile[i].get() if self.es and self.es.regfile and i < len(self.es.regfile) else 0x0000
-            
-            # Highlight if value changed
-            if reg_name in self.previous_reg_values and self.previous_reg_values[reg_name] != value:
-                painter.setPen(QPen(highlight_color, 1))
-            else:
-                painter.setPen(text_color)
-
-            painter.drawText(gpr_rect.x() + 5, reg_y_offset + i * reg_height, f"{reg_name}: 0x{value:04X}")
-            self.previous_reg_values[reg_name] = value # Update previous value for next repaint
-
         # --- Control Registers ---
-        cr_rect = QRect(cpu_rect.x(), cpu_rect.bottom() + 30, cpu_rect.width(), 150)
-        painter.fillRect(cr_rect, component_fill_color)
+        painter.fillRect(cr_rect, COMPONENT_FILL_COLOR)
         painter.drawRect(cr_rect)
-        painter.setPen(text_color)
-        painter.setFont(QFont("Arial", 12, QFont.Bold))
+        painter.setPen(TEXT_COLOR)
+        painter.setFont(self._font_label)
         painter.drawText(cr_rect.adjusted(0, 0, 0, -cr_rect.height() + 20), Qt.AlignCenter, "Control Registers")
 
-        painter.setFont(QFont("Courier New", 9))
-        cr_y_offset = cr_rect.y() + 30
-        cr_x_offset = cr_rect.x() + 10
-        cr_line_height = 15
-
-        # PC
-        pc_value = self.es.pc.get() if self.es and self.es.pc else 0x0000
-        painter.setPen(value_color)
-        painter.drawText(cr_x_offset, cr_y_offset, f"PC: 0x{pc_value:04X}")
-
-        # IR
-        ir_value = self.es.ir.get() if self.es and self.es.ir else 0x0000
-        painter.drawText(cr_x_offset, cr_y_offset + cr_line_height, f"IR: 0x{ir_value:04X}")
-
-        # Other control registers (simplified, can add more as needed)
-        status_value = self.es.status_reg.get() if self.es and self.es.status_reg else 0x0000
-        painter.drawText(cr_x_offset, cr_y_offset + 2 * cr_line_height, f"Status: 0x{status_value:04X}")
-
         # --- Memory Block ---
-        mem_rect = QRect(self.width() - 150, cpu_rect.y(), 100, 200)
-        painter.fillRect(mem_rect, component_fill_color)
+        painter.setPen(VALUE_COLOR)
+        painter.fillRect(mem_rect, COMPONENT_FILL_COLOR)
         painter.drawRect(mem_rect)
-        painter.setPen(text_color)
-        painter.setFont(QFont("Arial", 12, QFont.Bold))
+        painter.setPen(TEXT_COLOR)
+        painter.setFont(self._font_label)
         painter.drawText(mem_rect.adjusted(0, 0, 0, -mem_rect.height() + 20), Qt.AlignCenter, "Memory")
 
-        painter.setFont(QFont("Courier New", 8))
-        mem_y_offset = mem_rect.y() + 30
-        mem_x_offset = mem_rect.x() + 5
-        mem_line_height = 12
-        for i in range(8): # Display first 8 memory locations
-            addr = i
-            value = self.es.ab.read_mem16(self.es, addr) if self.es and self.es.ab else 0x0000
-            painter.setPen(value_color)
-            painter.drawText(mem_x_offset, mem_y_offset + i * mem_line_height, f"0x{addr:04X}: 0x{value:04X}")
-
         # --- Buses (simplified lines) ---
-        painter.setPen(QPen(bus_color, 2, Qt.DotLine)) # Dotted lines for buses
+        painter.setPen(self._pen_bus) # Dotted lines for buses
 
         # CPU to GPRs (Data/Control)
         painter.drawLine(cpu_rect.left(), cpu_rect.center().y(), gpr_rect.right(), gpr_rect.center().y())
@@ -135,6 +134,92 @@ class MachineView(QWidget):
         painter.drawLine(cpu_rect.right(), cpu_rect.center().y(), mem_rect.left(), mem_rect.center().y())
 
         painter.end()
+        self._bg_pixmap = pixmap
+
+    def _reg_row_rect(self, i):
+        # Band around the baseline of register i's text
+        base = self._gpr_rect.y() + 30 + i * REG_HEIGHT
+        return QRect(self._gpr_rect.x() + 1, base - REG_HEIGHT + 2, self._gpr_rect.width() - 2, REG_HEIGHT + 2)
+
+    def _read_values(self):
+        es = self.es
+        if es and es.ab:
+            # Straight from the state vector, so trace logging in the
+            # register get() is not triggered by the display
+            self.reg_values = es.ab.read_regs16(es)
+            self.mem_values = es.ab.read_mem16_block(es, 0, 8)
+        else:
+            self.reg_values = [0] * 16
+            self.mem_values = [0] * 8
+        if es and es.pc:
+            vec16 = es.vec16
+            self.ctl_values = (vec16[es.pc.vec_index], vec16[es.ir.vec_index],
+                               vec16[es.status_reg.vec_index])
+        else:
+            self.ctl_values = (0x0000, 0x0000, 0x0000)
+
+    def paintEvent(self, event):
+        if self._bg_pixmap is None:
+            self._build_background()
+        if self.reg_values is None:
+            self._read_values()
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self._bg_pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        clip = event.rect()
+
+        gpr_rect = self._gpr_rect
+        if clip.intersects(gpr_rect):
+            painter.setFont(self._font_mono)
+            reg_x = gpr_rect.x() + 5
+            reg_y_offset = gpr_rect.y() + 30
+            changed = self.changed_regs
+            for i in range(16):
+                # Highlight if value changed
+                painter.setPen(self._pen_highlight if i in changed else TEXT_COLOR)
+                painter.drawText(reg_x, reg_y_offset + i * REG_HEIGHT, value_text(REG_NAMES[i], self.reg_values[i]))
+
+        cr_rect = self._cr_rect
+        if clip.intersects(cr_rect):
+            painter.setFont(self._font_mono)
+            cr_y_offset = cr_rect.y() + 30
+            cr_x_offset = cr_rect.x() + 10
+            cr_line_height = 15
+            pc_value, ir_value, status_value = self.ctl_values
+            painter.setPen(VALUE_COLOR)
+            painter.drawText(cr_x_offset, cr_y_offset, value_text("PC", pc_value))
+            painter.drawText(cr_x_offset, cr_y_offset + cr_line_height, value_text("IR", ir_value))
+            # Other control registers (simplified, can add more as needed)
+            painter.drawText(cr_x_offset, cr_y_offset + 2 * cr_line_height, value_text("Status", status_value))
+
+        mem_rect = self._mem_rect
+        if clip.intersects(mem_rect):
+            painter.setFont(self._font_mono_sm)
+            mem_y_offset = mem_rect.y() + 30
+            mem_x_offset = mem_rect.x() + 5
+            mem_line_height = 12
+            painter.setPen(VALUE_COLOR)
+            for i in range(8): # Display first 8 memory locations
+                painter.drawText(mem_x_offset, mem_y_offset + i * mem_line_height, value_text(MEM_LABELS[i], self.mem_values[i]))
+
+        painter.end()
 
     def update_view(self):
-        self.update() # Schedules a paintEvent call
+        old_regs, old_ctl, old_mem = self.reg_values, self.ctl_values, self.mem_values
+        was_changed = self.changed_regs
+        self._read_values()
+        if old_regs is None or self._bg_pixmap is None:
+            self.update() # Schedules a paintEvent call
+            return
+        regs = self.reg_values
+        if regs == old_regs:
+            self.changed_regs = set()
+        else:
+            self.changed_regs = {i for i, (x, y) in enumerate(zip(regs, old_regs)) if x != y}
+        # Repaint only the rows that changed now or were highlighted before
+        for i in self.changed_regs | was_changed:
+            self.update(self._reg_row_rect(i))
+        if self.ctl_values != old_ctl:
+            self.update(self._cr_rect)
+        if self.mem_values != old_mem:
+            self.update(self._mem_rect)
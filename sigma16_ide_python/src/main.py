@@ -71,11 +71,14 @@ def run_file(file_path, dump_mem=False, dump_regs=False, verbose=False):
         # Run instructions until halted or a limit (e.g., 1000 instructions)
         # For now, let's run a fixed number of steps or until halt
         max_instructions = 1000
+        read_scb = es.ab.read_scb
+        scb_status, scb_halted = es.ab.SCB_STATUS, es.ab.SCB_HALTED
+        execute_instruction = em.execute_instruction
         for _ in range(max_instructions):
-            if es.ab.read_scb(es, es.ab.SCB_STATUS) == es.ab.SCB_HALTED:
+            if read_scb(es, scb_status) == scb_halted:
                 print("Emulator halted.")
                 break
-            em.execute_instruction(es)
+            execute_instruction(es)
         else:
             print(f"Emulator stopped after {max_instructions} instructions (limit reached).")
 
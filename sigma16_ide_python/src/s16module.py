@@ -26,17 +26,16 @@ import state as st
 # File handling utilities
 # --------------------------------------------------------------------------
 
+def split_file_name(fname):
+    # Base name and extension (from the first dot) in one scan
+    head, sep, tail = fname.partition(".")
+    return head, sep + tail
+
 def get_file_base_name(fname):
-    i = fname.find(".")
-    if i != -1:
-        return fname[:i]
-    return fname
+    return fname.partition(".")[0]
 
 def get_file_extension(fname):
-    i = fname.find(".")
-    if i != -1:
-        return fname[i:]
-    return ""
+    return split_file_name(fname)[1]
 
 # --------------------------------------------------------------------------
 # Sigma16 Module (moved from state.py for better organization)
@@ -56,7 +55,8 @@ class Sigma16Module:
 
         self.asm_src_code_origin = "none"
         self.current_asm_src = text
-        self.asm_src_lines = text.split("\n")
+        self._lines_src = None # text that _asm_src_lines was split from
+        self._asm_src_lines = []
         self.saved_asm_src = None
         self.asm_info = None
 
@@ -66,6 +66,14 @@ class Sigma16Module:
         self.exe_code_origin = "none"
         self.exe_obj_md = None
 
+    @property
+    def asm_src_lines(self):
+        # Split on demand, and again only once the source text has changed
+        if self._lines_src is not self.current_asm_src:
+            self._lines_src = self.current_asm_src
+            self._asm_src_lines = self.current_asm_src.split("\n")
+        return self._asm_src_lines
+
     def ident(self):
         return f"module {self.mod_key}"
 
@@ -85,7 +93,6 @@ class Sigma16Module:
     def set_asm_code(self, txt, origin):
         self.asm_src_code_origin = origin
         self.current_asm_src = txt
-        self.asm_src_lines = txt.split("\n")
         # GUI update logic here later
 
     def set_obj_code(self, txt, origin):
@@ -132,12 +139,16 @@ class ModuleSet:
     def __init__(self):
         common.mode.devlog("Initializing ModuleSet")
         self.modules = []
+        self.by_name = {} # module_name -> module
+        self.by_key = {} # mod_key -> module
         self.selected_module_idx = 0
         self.previous_selected_idx = 0
 
     def add_module(self, name, text):
         m = Sigma16Module(name, text)
         self.modules.append(m)
+        self.by_name[name] = m
+        self.by_key[m.mod_key] = m
         self.selected_module_idx = len(self.modules) - 1
         # GUI update logic here later
         return m
@@ -147,6 +158,12 @@ class ModuleSet:
             return None # Or raise an error, depending on desired behavior
         return self.modules[self.selected_module_idx]
 
+    def get_by_name(self, name):
+        return self.by_name.get(name)
+
+    def get_by_key(self, key):
+        return self.by_key.get(key)
+
     def refresh_display(self):
         # GUI update logic here later
         pass
@@ -158,19 +175,19 @@ st.env.module_set = ModuleSet()
 # File handling functions (placeholders for now)
 # --------------------------------------------------------------------------
 
-async def open_file():
+def open_file():
     print("open_file: Not implemented for CLI")
 
-async def refresh_file():
+def refresh_file():
     print("refresh_file: Not implemented for CLI")
 
-async def save_file():
+def save_file():
     print("save_file: Not implemented for CLI")
 
-async def save_as_file():
+def save_as_file():
     print("save_as_file: Not implemented for CLI")
 
-async def open_directory():
+def open_directory():
     print("open_directory: Not implemented for CLI")
 
 # --------------------------------------------------------------------------
@@ -193,19 +210,20 @@ def handle_mod_up(m):
     print(f"handle_mod_up: Module {m.module_name} moved up")
     # GUI-specific logic to reorder modules
 
-async def handle_mod_refresh(m):
+def handle_mod_refresh(m):
     print(f"handle_mod_refresh: Module {m.module_name} refreshed")
     # GUI-specific logic to refresh module content from file
 
 def handle_close(m):
     print(f"handle_close: Module {m.module_name} closed")
     # GUI-specific logic to remove module from display and list
-    if st.env.module_set:
+    ms = st.env.module_set
+    if ms:
         i = m.mod_idx
-        a = st.env.module_set.modules
+        a = ms.modules
 
-        si = st.env.module_set.selected_module_idx
-        pi = st.env.module_set.previous_selected_idx
+        si = ms.selected_module_idx
+        pi = ms.previous_selected_idx
 
         if si == i:
             si = max(0, si - 1)
@@ -217,12 +235,17 @@ def handle_close(m):
         elif pi > i:
             pi -= 1
 
-        st.env.module_set.selected_module_idx = si
-        st.env.module_set.previous_selected_idx = pi
+        ms.selected_module_idx = si
+        ms.previous_selected_idx = pi
+
+        ms.by_key.pop(m.mod_key, None)
+        if ms.by_name.get(m.module_name) is m:
+            del ms.by_name[m.module_name]
 
+        # Keep the display order; only the modules after i move down
         a.pop(i)
-        for j in range(i, len(a)):
-            a[j].mod_idx = j
+        for j, x in enumerate(a[i:], i):
+            x.mod_idx = j
 
 # --------------------------------------------------------------------------
 # FileRecord and related functions (legacy, may not be fully ported)
@@ -19,7 +19,13 @@
 # emulator, including key data structures.
 # -------------------------------------------------------------------------
 
+import functools
 import re
+import sys
+from array import array
+from bisect import bisect_right
+from itertools import chain
+
 import common
 import arithmetic as arith
 import architecture as arch
@@ -100,7 +106,8 @@ class Sigma16Module:
 
         self.asm_src_code_origin = "none"
         self.current_asm_src = text
-        self.asm_src_lines = text.split("\n")
+        self._lines_src = None # text that _asm_src_lines was split from
+        self._asm_src_lines = []
         self.saved_asm_src = None
         self.asm_info = None
 
@@ -110,6 +117,14 @@ class Sigma16Module:
         self.exe_code_origin = "none"
         self.exe_obj_md = None
 
+    @property
+    def asm_src_lines(self):
+        # Split on demand, and again only once the source text has changed
+        if self._lines_src is not self.current_asm_src:
+            self._lines_src = self.current_asm_src
+            self._asm_src_lines = self.current_asm_src.split("\n")
+        return self._asm_src_lines
+
     def ident(self):
         return f"module {self.mod_key}"
 
@@ -129,7 +144,6 @@ class Sigma16Module:
     def set_asm_code(self, txt, origin):
         self.asm_src_code_origin = origin
         self.current_asm_src = txt
-        self.asm_src_lines = txt.split("\n")
         # GUI update logic will go here later
 
     def set_obj_code(self, txt, origin):
@@ -192,12 +206,16 @@ class ModuleSet:
     def __init__(self):
         common.mode.devlog("Initializing ModuleSet")
         self.modules = []
+        self.by_name = {} # module_name -> module
+        self.by_key = {} # mod_key -> module
         self.selected_module_idx = 0
         self.previous_selected_idx = 0
 
     def add_module(self, name, text):
         m = Sigma16Module(name, text)
         self.modules.append(m)
+        self.by_name[name] = m
+        self.by_key[m.mod_key] = m
         self.selected_module_idx = len(self.modules) - 1
         # GUI update logic will go here later
         return m
@@ -205,6 +223,12 @@ class ModuleSet:
     def get_selected_module(self):
         return self.modules[self.selected_module_idx]
 
+    def get_by_name(self, name):
+        return self.by_name.get(name)
+
+    def get_by_key(self, key):
+        return self.by_key.get(key)
+
     def refresh_display(self):
         # GUI update logic will go here later
         pass
@@ -218,7 +242,6 @@ class AsmInfo:
         self.asm_mod_name = base_name
         self.base_name = base_name
         self.asm_src_text = src_text
-        self.asm_src_lines = src_text.split("\n")
         self.object_code = []
         self.object_text = ""
         self.md_text = ""
@@ -234,22 +257,25 @@ class AsmInfo:
         self.n_asm_errors = 0
         self.obj_md = None
 
+    @functools.cached_property
+    def asm_src_lines(self):
+        return self.asm_src_text.split("\n")
+
     def show_short(self):
-        xs = "AsmInfo\n"
         show_src = "\n".join(self.asm_src_lines[:4])
         show_obj = "\n".join(self.object_code[:4])
-        xs += f" asm_mod_name={self.asm_mod_name}\n"
-        xs += show_src + "\n"
-        xs += show_obj + "\n"
-        return xs
+        return f"AsmInfo\n asm_mod_name={self.asm_mod_name}\n" \
+               f"{show_src}\n{show_obj}\n"
 
 # ----------------------------------------------------------------------
 # Symbol table
 # ----------------------------------------------------------------------
 
 class Identifier:
+    __slots__ = ("name", "mod", "extname", "value", "def_line", "usage_lines")
+
     def __init__(self, name, mod, extname, v, def_line):
-        self.name = name
+        self.name = sys.intern(name)
         self.mod = mod
         self.extname = extname
         self.value = v
@@ -284,27 +310,39 @@ External = "Ext"      # defined in another module
 Fixed = "Fix"         # constant
 Relocatable = "Rel"   # changes during relocation
 
+# Movability of a sum: adding a fixed value keeps the other operand's
+# movability, and two relocatable values give a fixed result
+
+MOV_COMBINE = {
+    (Fixed, Fixed): Fixed,
+    (Fixed, Relocatable): Relocatable,
+    (Relocatable, Fixed): Relocatable,
+    (Relocatable, Relocatable): Fixed,
+}
+
 class Value:
+    # Fixed fields, as with a C struct: no per-instance __dict__, and
+    # attribute access is a slot load
+    __slots__ = ("word", "origin", "movability", "_s")
+
     def __init__(self, v, o, m):
         self.word = v
         self.origin = o
         self.movability = m
+        self._s = None # to_string text, cleared when add changes the value
 
     def copy(self):
         return Value(self.word, self.origin, self.movability)
 
     def add(self, k):
         self.word = self.word + k.word
-        if k.movability == Fixed:
-            self.movability = self.movability
-        elif self.movability == Fixed:
-            self.movability = k.movability
-        else:
-            self.movability = Fixed # Both relocatable, result is fixed
+        self.movability = MOV_COMBINE[(self.movability, k.movability)]
+        self._s = None
 
     def to_string(self):
-        xs = f"{arith.word_to_hex4(self.word)} {self.origin} {self.movability}"
-        return xs
+        if self._s is None:
+            self._s = f"{self.word & 0xFFFF:04x} {self.origin} {self.movability}"
+        return self._s
 
 ExtVal = Value(0, External, Fixed)
 
@@ -321,85 +359,113 @@ Two = mk_const_val(2)
 
 elts_per_line_limit = 4
 
+# Empty address -> source index map, copied by each Metadata; a flat
+# array indexed by address rather than a dict
+NO_MAPPING = array('i', [-1]) * arch.mem_size
+
+# Addresses wrap to the 16-bit address space, as in the emulator, so a
+# module relocated past the top of memory or a bad .md file can't index
+# outside map_arr
+mem_mask = arch.mem_size - 1
+
 class Metadata:
     def __init__(self):
         self.clear()
 
     def clear(self):
-        self.pairs = []
-        self.map_arr = {} # Using dict for mapArr
-        self.listing_text = []
-        self.listing_plain = []
-        self.listing_dec = []
+        self.pair_addrs = [] # address/index pairs, kept as two parallel lists
+        self.pair_idxs = []
+        self.map_arr = NO_MAPPING[:] # source index for each address, -1 if none
+        self.sorted_map = None # (addrs, idxs) sorted by address, built on demand
+        self.listing = [] # (text, plain, decorated) for each source line
         self.md_text = None
         self.adr_offset = 0
         self.src_offset = 0
 
-    def add_pairs(self, ps):
-        for p in ps:
-            self.map_arr[p["address"]] = p["index"]
-            self.pairs.append(p)
+    @property
+    def pairs(self):
+        # The pairs as {"address", "index"} dicts, built on demand
+        return [{"address": a, "index": i}
+                for a, i in zip(self.pair_addrs, self.pair_idxs)]
+
+    def add_pairs(self, addrs, idxs):
+        m = self.map_arr
+        add_addr = self.pair_addrs.append
+        for a, i in zip(addrs, idxs):
+            a &= mem_mask
+            m[a] = i
+            add_addr(a)
+        self.pair_idxs.extend(idxs)
+        self.sorted_map = None
 
     def translate_map(self, adr_offset, src_offset):
         self.adr_offset = adr_offset
         self.src_offset = src_offset
-        xs = []
-        self.map_arr = {}
-        for x in self.pairs:
-            p = {"address": x["address"] + adr_offset,
-                 "index": x["index"] + src_offset}
-            xs.append(p)
-            self.map_arr[x["address"] + adr_offset] = x["index"] + src_offset
-        self.pairs = xs
+        if adr_offset == 0 and src_offset == 0:
+            return # e.g. the first module of a link: nothing moves
+        # Shift the pairs and refill map_arr in a single pass
+        m = NO_MAPPING[:]
+        addrs, idxs = [], []
+        add_addr, add_idx = addrs.append, idxs.append
+        for a, i in zip(self.pair_addrs, self.pair_idxs):
+            a = (a + adr_offset) & mem_mask
+            i += src_offset
+            m[a] = i
+            add_addr(a)
+            add_idx(i)
+        self.pair_addrs, self.pair_idxs, self.map_arr = addrs, idxs, m
+        self.sorted_map = None
 
     def add_mapping_src(self, a, i, src_text, src_plain, src_dec):
-        p = {"address": a, "index": i}
-        self.pairs.append(p)
+        a &= mem_mask
+        self.pair_addrs.append(a)
+        self.pair_idxs.append(i)
         self.map_arr[a] = i
-        self.listing_text.append(src_text)
-        self.listing_plain.append(src_plain)
-        self.listing_dec.append(src_dec)
+        self.sorted_map = None
+        self.listing.append((src_text, src_plain, src_dec))
 
     def add_mapping(self, a, i):
-        p = {"address": a, "index": i}
-        self.pairs.append(p)
+        a &= mem_mask
+        self.pair_addrs.append(a)
+        self.pair_idxs.append(i)
         self.map_arr[a] = i
+        self.sorted_map = None
 
     def push_src(self, src_text, src_plain, src_dec):
-        self.listing_text.append(src_text)
-        self.listing_plain.append(src_plain)
-        self.listing_dec.append(src_dec)
+        self.listing.append((src_text, src_plain, src_dec))
 
     def unshift_src(self, src_text, src_plain, src_dec):
-        self.listing_text.insert(0, src_text)
-        self.listing_plain.insert(0, src_plain)
-        self.listing_dec.insert(0, src_dec)
+        self.listing.insert(0, (src_text, src_plain, src_dec))
 
     def add_src(self, i, src_text, src_plain, src_dec):
-        # Ensure lists are large enough
-        while len(self.listing_text) <= i:
-            self.listing_text.append("")
-            self.listing_plain.append("")
-            self.listing_dec.append("")
-        self.listing_text[i] = src_text
-        self.listing_plain[i] = src_plain
-        self.listing_dec[i] = src_dec
+        # Ensure the list is large enough, padding in one extend
+        n = i + 1 - len(self.listing)
+        if n > 0:
+            self.listing.extend([("", "", "")] * n)
+        self.listing[i] = (src_text, src_plain, src_dec)
 
     def get_src_idx(self, a):
-        i = self.map_arr.get(a)
-        return i if i is not None else 0
+        # An unmapped address (e.g. the second word of an instruction)
+        # falls back to the nearest lower mapped address, or 0 if none
+        a &= mem_mask
+        i = self.map_arr[a]
+        if i >= 0:
+            return i
+        if self.sorted_map is None:
+            ps = sorted(zip(self.pair_addrs, self.pair_idxs))
+            self.sorted_map = ([q[0] for q in ps], [q[1] for q in ps])
+        addrs, idxs = self.sorted_map
+        j = bisect_right(addrs, a) - 1
+        return idxs[j] if j >= 0 else 0
 
     def get_src_text(self, a):
-        x = self.listing_text[self.get_src_idx(a)]
-        return x if x is not None else f"no text src for {a}"
+        return self.listing[self.get_src_idx(a)][0]
 
     def get_src_plain(self, a):
-        x = self.listing_plain[self.get_src_idx(a)]
-        return x if x is not None else f"no plain src for {a}"
+        return self.listing[self.get_src_idx(a)][1]
 
     def get_src_dec(self, a):
-        x = self.listing_dec[self.get_src_idx(a)]
-        return x if x is not None else f"no decorated src for {a}"
+        return self.listing[self.get_src_idx(a)][2]
 
     def get_md_text(self):
         if not self.md_text:
@@ -407,10 +473,16 @@ class Metadata:
         return self.md_text
 
     def add_src_lines(self, xs):
-        for i in range(0, len(xs), 3):
-            self.listing_text.append(xs[i])
-            self.listing_plain.append(xs[i+1])
-            self.listing_dec.append(xs[i+2])
+        it = iter(xs)
+        self.listing.extend(zip(it, it, it))
+
+    def add_src_from(self, md):
+        # Append another metadata's listing directly, without interleaving
+        # it into source lines first
+        self.listing.extend(md.listing)
+
+    def n_src_lines(self):
+        return len(self.listing)
 
     def set_md_text(self, xs):
         self.md_text = xs
@@ -419,63 +491,45 @@ class Metadata:
         self.clear()
         self.md_text = x
         xs = x.split("\n")
-        ns = []
+        n = len(xs)
         i = 0
-        while i < len(xs) and not xs[i].startswith("source"):
-            ys = xs[i].split(",")
-            ns.extend([int(q) for q in ys if q.strip()]) # Ensure q is not empty
+        while i < n and not xs[i].startswith("source"):
             i += 1
-        
-        j = 0
-        while j < len(ns):
-            a = ns[j] if ns[j] is not None else 0
-            idx = ns[j+1] if ns[j+1] is not None else 0
-            self.add_mapping(a, idx)
-            j += 2
-        
+
+        # Address/index pairs, flattened over the lines before "source"
+        ns = [int(q) for line in xs[:i] for q in line.split(",") if q.strip()]
+        self.pair_addrs = [a & mem_mask for a in ns[0::2]]
+        self.pair_idxs = ns[1::2]
+        m = self.map_arr
+        for a, idx in zip(self.pair_addrs, self.pair_idxs):
+            m[a] = idx
+
         i += 1 # skip "source"
-        j = 0
-        while i < len(xs):
+        listing = self.listing
+        while i < n:
             if xs[i] != "":
-                self.listing_text.append(xs[i])
-                self.listing_plain.append(xs[i+1])
-                self.listing_dec.append(xs[i+2])
-                j += 1
+                listing.append((xs[i], xs[i+1], xs[i+2]))
                 i += 3
             else:
                 i += 1 # skip empty line
 
     def map_to_texts(self):
-        xs = []
-        for p in self.pairs:
-            xs.extend([p["address"], p["index"]])
-        
-        ys = []
-        temp_xs = list(xs) # Create a mutable copy
-        while len(temp_xs) > 0:
-            ys.append(temp_xs[:elts_per_line_limit])
-            temp_xs = temp_xs[elts_per_line_limit:]
-        
-        zs = []
-        for y in ys:
-            zs.append(",".join(map(str, y)))
-        return zs
+        xs = [0] * (2 * len(self.pair_addrs))
+        xs[0::2] = self.pair_addrs
+        xs[1::2] = self.pair_idxs
+        n = elts_per_line_limit
+        return [",".join(map(str, xs[i:i+n])) for i in range(0, len(xs), n)]
 
     def get_src_lines(self):
-        xs = []
-        for i in range(len(self.listing_plain)):
-            xs.append(self.listing_text[i])
-            xs.append(self.listing_plain[i])
-            xs.append(self.listing_dec[i])
-        return xs
+        return list(chain.from_iterable(self.listing))
 
     def get_plain_lines(self):
-        return list(self.listing_plain)
+        return [plain for _, plain, _ in self.listing]
 
     def to_text(self):
         xs = self.map_to_texts()
         xs.append("source")
-        xs.extend(self.get_src_lines())
+        xs.extend(chain.from_iterable(self.listing))
         return "\n".join(xs)
 
 # -------------------------------------------------------------------------
@@ -483,23 +537,25 @@ class Metadata:
 # -------------------------------------------------------------------------
 
 class AsmImport:
+    __slots__ = ("mod", "name", "addr", "addr_num", "field")
+
     def __init__(self, mod, name, addr, field):
         self.mod = mod
         self.name = name
         self.addr = addr
+        self.addr_num = arith.hex4_to_word(addr)  # parsed once, used by the linker
         self.field = field
 
     def show(self):
         return f"AsmImport mod={self.mod} name={self.name} " \
-               f"addr={arith.word_to_hex4(self.addr)} field={self.field}\n"
+               f"addr={arith.word_to_hex4(self.addr_num)} field={self.field}\n"
 
 def show_asm_imports(xs):
-    r = "AsmImports...\n"
-    for x in xs:
-        r += x.show()
-    return r
+    return "AsmImports...\n" + "".join(x.show() for x in xs)
 
 class AsmExport:
+    __slots__ = ("name", "val", "status")
+
     def __init__(self, name, val, status):
         self.name = name
         self.val = val
@@ -510,29 +566,21 @@ class AsmExport:
                f" status={self.status}"
 
 def show_mod_map(m):
-    r = "Module map...\n"
-    for k in m.keys():
-        r += f"key {k} -> {len(m[k].object_lines)}\n"
-    return r
+    return "Module map...\n" + "".join(
+        f"key {k} -> {len(v.object_lines)}\n" for k, v in m.items())
 
 def show_asm_export_map(m):
-    r = ""
-    for k in m.keys():
-        r += f"key {k} -> {m[k].show()}"
-    return r
+    return "".join(f"key {k} -> {v.show()}" for k, v in m.items())
 
 def show_asm_exports(xs):
-    r = "AsmExports...\n"
-    for x in xs:
-        r += x.show()
-    return r
+    return "AsmExports...\n" + "".join(x.show() for x in xs)
 
 def show_blocks(bs):
-    xs = ""
+    xs = []
     for b in bs:
-        xs += b.show_block()
+        xs.append(b.show_block())
         print(b.xs)
-    return xs
+    return "".join(xs)
 
 # -------------------------------------------------------------------------
 # Container for object code and metadata
@@ -542,58 +590,61 @@ class ObjMd:
     def __init__(self, mod_name, obj_text, md_text):
         self.mod_name = mod_name
         self.obj_text = obj_text
-        self.obj_lines = obj_text.split("\n")
         self.md_text = md_text
-        self.md_lines = md_text.split("\n") if md_text else []
         self.is_executable = self.check_executable()
 
+    # The texts are split into lines only when the lines are needed
+
+    @functools.cached_property
+    def obj_lines(self):
+        return self.obj_text.split("\n")
+
+    @functools.cached_property
+    def md_lines(self):
+        return self.md_text.split("\n") if self.md_text else []
+
     def check_executable(self):
-        ok = True
-        ok &= len(self.obj_lines) > 0
-        for xs in self.obj_lines:
-            fields = parse_obj_line(xs)
-            if fields["operation"] == "import":
-                common.mode.devlog(f"check executable: import ({fields['operands']})")
-                print(f"check executable: import ({fields['operands']})")
-                ok = False
-        return ok
+        # Executable if there is code and no import line; stops at the
+        # first import rather than parsing every line
+        if not self.obj_text:
+            return False
+        m = import_line.search(self.obj_text)
+        if m:
+            end = self.obj_text.find("\n", m.start())
+            op, operands = parse_obj_line(self.obj_text[m.start():end if end >= 0 else None])
+            common.mode.devlog(f"check executable: import ({operands})")
+            print(f"check executable: import ({operands})")
+            return False
+        return True
 
     def has_object_code(self):
         return bool(self.obj_text)
 
     def show_short(self):
-        xs = "Object/Metadata:\n"
-        xs += f"object module {self.mod_name} with " \
-              f"{len(self.obj_lines)} lines of object text\n"
-        xs += "\n".join(self.obj_lines[:3]) + "\n"
-        xs += f"{len(self.md_lines)} lines of metadata text\n"
-        xs += "\n".join(self.md_lines[:3])
-        return xs
+        show_obj = "\n".join(self.obj_lines[:3])
+        show_md = "\n".join(self.md_lines[:3])
+        return f"Object/Metadata:\nobject module {self.mod_name} with " \
+               f"{len(self.obj_lines)} lines of object text\n{show_obj}\n" \
+               f"{len(self.md_lines)} lines of metadata text\n{show_md}"
 
 # -------------------------------------------------------------------------
 # Object code parser
 # -------------------------------------------------------------------------
 
+obj_line_parser = re.compile(r"^([a-z]+)(?:\s+(.*))?$")
+import_line = re.compile(r"^import(?=\s|$)", re.M)
+
+# Split an object code line into (operation, operands); a blank line
+# gives ("", [])
+
 def parse_obj_line(xs):
-    obj_line_parser = re.compile(r"^([a-z]+)(?:\s+(.*))?$")
-    blank_line_parser = re.compile(r"^\s*$")
-    
-    operation = ""
-    operands = []
-    
-    blank_line_match = blank_line_parser.match(xs)
-    split_line_match = obj_line_parser.match(xs)
-    
-    if split_line_match:
-        operation = split_line_match.group(1)
-        if split_line_match.group(2):
-            operands = split_line_match.group(2).split(",")
-    elif blank_line_match:
-        pass # Blank line, do nothing
-    else:
+    m = obj_line_parser.match(xs)
+    if m:
+        operands = m.group(2)
+        return m.group(1), operands.split(",") if operands else []
+    if xs and not xs.isspace():
         print(f"linker error: object line has invalid format: {xs}")
-    
-    return {"operation": operation, "operands": operands}
+    return "", []
 
 # -------------------------------------------------------------------------
 # Linker state
@@ -604,6 +655,7 @@ class LinkerState:
         self.main_name = main_name
         self.obj_mds = obj_mds
         self.mod_map = {} # Using dict for Map
+        self.global_exports = {} # (mod_name, name) -> AsmExport
         self.oi_list = []
         self.m_count = 0
         self.location_counter = 0
@@ -622,13 +674,11 @@ class LinkerState:
         print("End of modMap")
 
     def show(self):
-        xs = "Linker state:\n"
-        xs += f"Location counter = {arith.word_to_hex4(self.location_counter)}\n"
-        xs += f"{len(self.link_errors)} Error messages: {self.link_errors}\n"
-        xs += f"metadata.pairs.length = {len(self.metadata.pairs)}\n"
-        xs += self.exe_code_text
-        xs += self.exe_md_text
-        return xs
+        return f"Linker state:\n" \
+               f"Location counter = {arith.word_to_hex4(self.location_counter)}\n" \
+               f"{len(self.link_errors)} Error messages: {self.link_errors}\n" \
+               f"metadata.pairs.length = {len(self.metadata.pair_addrs)}\n" \
+               f"{self.exe_code_text}{self.exe_md_text}"
 
 # -------------------------------------------------------------------------
 # Object Info
@@ -645,7 +695,6 @@ class ObjectInfo:
         self.obj_text = obj_md.obj_text
         self.md_text = obj_md.md_text
         self.object_lines = [] # Will be populated by parse_object
-        self.md_lines = self.md_text.split("\n") if self.md_text else []
         self.metadata = None # Will be populated by parse_object
         self.start_address = 0
         self.src_line_origin = 0
@@ -655,6 +704,10 @@ class ObjectInfo:
         self.asm_export_map = {} # Using dict for Map
         self.om_asm_exports = []
 
+    @functools.cached_property
+    def md_lines(self):
+        return self.md_text.split("\n") if self.md_text else []
+
     def show(self):
         # Simplified for console output
         xs = f"ObjectInfo for {self.mod_name}\n"
@@ -666,19 +719,26 @@ class ObjectInfo:
         return xs
 
 class ObjectBlock:
+    __slots__ = ("block_start", "block_size", "xs")
+
     def __init__(self, block_start):
         self.block_start = block_start
         self.block_size = 0
-        self.xs = []
+        self.xs = array('H') # packed 16-bit words
 
     def show_block(self):
+        h = arith.words_to_hex(self.xs)
         return f"Block of {self.block_size} words from " \
                f"{arith.word_to_hex4(self.block_start)}: " \
-               f"{[arith.word_to_hex4(x) for x in self.xs]}"
+               f"{[h[i:i+4] for i in range(0, len(h), 4)]}"
 
     def insert_word(self, x):
-        self.xs.append(x)
+        self.xs.append(x & 0xFFFF)
         self.block_size += 1
 
+    def insert_words(self, ws):
+        self.xs.extend(ws)
+        self.block_size += len(ws)
+
 # Initialize the global module set
 env.module_set = ModuleSet()
@@ -1,7 +1,10 @@
 import pytest
 from emulator import EmulatorState
+import emulator as em
 import common
 import arrbuf as ab
+import state as st
+import assembler
 
 def test_emulator_init():
     es = EmulatorState(common.ES_gui_thread, ab)
@@ -10,3 +13,118 @@ def test_emulator_init():
     assert es.vec16 is not None
     assert es.vec32 is not None
     assert es.vec64 is not None
+
+def test_looper_resumes_after_pause():
+    es = EmulatorState(common.ES_gui_thread, ab)
+    em.proc_reset(es)
+    for a in range(10):
+        em.mem_store(es, a, 0x0112) # add R1,R1,R2
+    em.mem_store(es, 10, 0xc000) # trap R0,R0,R0 (halt)
+    es.regfile[2].put(1)
+    es.em_instr_slice_size = 3
+    ab.write_scb(es, ab.SCB_STATUS, ab.SCB_READY)
+    ab.write_scb(es, ab.SCB_PAUSE_REQUEST, 1)
+    em.main_run(es)
+    assert es.halt_reason == "paused"
+    assert es.regfile[1].get() == 3
+    em.main_run(es)
+    assert es.halt_reason == "halted"
+    assert es.regfile[1].get() == 10
+
+def test_translate_map_wraps_at_top_of_memory():
+    md = st.Metadata()
+    md.add_pairs([0xfffe, 0xffff], [1, 2])
+    md.translate_map(3, 10)
+    assert md.pair_addrs == [1, 2]
+    assert md.get_src_idx(1) == 11
+    assert md.get_src_idx(2) == 12
+    assert md.get_src_idx(0) == 0
+
+def test_metadata_from_text_wraps_bad_addresses():
+    md = st.Metadata()
+    md.from_text("70000,1,-1,2\nsource\na\nb\nc\nd\ne\nf\ng\nh\ni")
+    assert md.pair_addrs == [70000 & 0xffff, 0xffff]
+    assert md.get_src_idx(70000 & 0xffff) == 1
+    assert md.get_src_idx(0xffff) == 2
+
+# Bit 3 of R1 is tested with the other bits set the opposite way, and
+# the branch offset is 5; brc0/brc1 branch forward like brfc0/brfc1
+
+@pytest.mark.parametrize("name, sign, want", [
+    ("brfc0", 1, 0),
+    ("brbc0", -1, 0),
+    ("brfc1", 1, 1),
+    ("brbc1", -1, 1),
+    ("brc0", 1, 0),
+    ("brc1", 1, 1),
+])
+def test_branch_on_bit(name, sign, want):
+    handler = getattr(em, f"exp2_{name}")
+    es = EmulatorState(common.ES_gui_thread, ab)
+    for bit in (0, 1):
+        es.regfile[1].put(0x0008 if bit else 0xfff7)
+        es.ir_d = 1
+        es.instr_disp = 0x3005 # e=3, offset 5
+        es.pc.put(0x0020)
+        handler(es, em.decode_exp_fields(es.instr_disp))
+        assert es.pc.get() == (0x0020 + sign * 5 if bit == want else 0x0020)
+
+@pytest.mark.parametrize("code, want", [(0x0c, 0), (0x0d, 1)], ids=["brc0", "brc1"])
+def test_brc_executes_through_dispatch(code, want):
+    es = EmulatorState(common.ES_gui_thread, ab)
+    for bit in (0, 1):
+        em.proc_reset(es)
+        em.mem_store(es, 0x0020, 0xe100 | code) # brc0/brc1 R1,3,...
+        em.mem_store(es, 0x0021, 0x3005)
+        es.regfile[1].put(0x0008 if bit else 0xfff7)
+        es.pc.put(0x0020)
+        em.execute_instruction(es)
+        assert es.pc.get() == (0x0027 if bit == want else 0x0022)
+
+def test_traced_and_fast_paths_agree():
+    src = "\n".join([
+        "     lea    R1,1[R0]",
+        "     lea    R2,10[R0]",
+        "loop add    R3,R3,R2",
+        "     store  R3,arr[R2]",
+        "     sub    R2,R2,R1",
+        "     jumpnz R2,loop[R0]",
+        "     load   R4,arr[R1]",
+        "     mul    R5,R4,R3",
+        "     trap   R0,R0,R0",
+        "arr  data   0",
+    ])
+    obj_md = assembler.assembler("t", src).obj_md
+    results = []
+    for trace in (True, False):
+        es = EmulatorState(common.ES_gui_thread, ab)
+        em.boot(es, obj_md)
+        es.trace_enabled = trace
+        n = em.execute_batch(es, 1000)
+        assert es.halt_reason == "halted"
+        assert es.regfile[4].get() == 55
+        results.append((n, es.pc.get(), list(es.vec16)))
+    assert results[0] == results[1]
+
+# The relative branches take the offset from adr; None means the branch
+# is unconditional, otherwise it is taken when (Rd == 0) == want_zero
+
+@pytest.mark.parametrize("name, sign, want_zero", [
+    ("brf", 1, None),
+    ("brb", -1, None),
+    ("brfz", 1, True),
+    ("brbz", -1, True),
+    ("brfnz", 1, False),
+    ("brbnz", -1, False),
+])
+def test_relative_branch(name, sign, want_zero):
+    handler = getattr(em, f"exp2_{name}")
+    es = EmulatorState(common.ES_gui_thread, ab)
+    for x in (0, 7):
+        es.regfile[1].put(x)
+        es.ir_d = 1
+        es.adr.put(5)
+        es.pc.put(0x0020)
+        handler(es, em.decode_exp_fields(0))
+        taken = want_zero is None or (x == 0) == want_zero
+        assert es.pc.get() == (0x0020 + sign * 5 if taken else 0x0020)